@@ -0,0 +1,61 @@
+# Core_Code/_indicators_njit.py
+import math
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # numba is in requirements.txt; without it the kernels still work as plain Python
+    HAVE_NUMBA = False   # strategy_engine logs the fallback once its log file is configured
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+
+# -----------------------------
+# Streaming indicator kernels (O(1) per tick)
+# -----------------------------
+@njit(cache=True)
+def sma_stream(prev_sum, new, old, n):
+    """Slide a window sum: add `new`, drop `old` (0.0 while the window fills). Returns (sum, mean over n)."""
+    s = prev_sum + new - old
+    return s, s / n
+
+
+@njit(cache=True)
+def welford_update(mean, m2, n, x):
+    """Welford step for a growing window; `n` is the count after adding `x`. Returns (mean, m2)."""
+    delta = x - mean
+    mean += delta / n
+    m2 += delta * (x - mean)
+    return mean, m2
+
+
+@njit(cache=True)
+def welford_slide(mean, m2, n, new, old):
+    """Welford step for a full window of `n`: replace `old` with `new`. Returns (mean, m2)."""
+    new_mean = mean + (new - old) / n
+    m2 += (new - old) * (new - new_mean + old - mean)
+    return new_mean, max(m2, 0.0)
+
+
+@njit(cache=True)
+def sample_std(m2, n):
+    """Sample std (ddof=1) from Welford state, 0 for a single point like rolling().std().fillna(0)."""
+    if n < 2:
+        return 0.0
+    return math.sqrt(m2 / (n - 1))
+
+
+# -----------------------------
+# Tick decision kernel
+# -----------------------------
+@njit(cache=True)
+def decide(put_val, call_val, data_diff, pcr):
+    """OI decision for one tick: 0 = NEUTRAL, 1 = CALL, 2 = PUT (NaN inputs fall through to NEUTRAL)."""
+    if put_val - call_val > 0 and data_diff > 0 and pcr > 1.25:
+        return 1
+    if put_val - call_val < 0 and data_diff < 0 and pcr < 0.75:
+        return 2
+    return 0
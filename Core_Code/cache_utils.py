@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import update_wrapper, wraps
+
+
+# -------------------------------
+# TTL + LRU memoization
+# -------------------------------
+class _TTLStore:
+    """One TTL/LRU cache with single-flighted misses: one caller computes a key, the rest wait for it."""
+
+    def __init__(self, seconds, maxsize):
+        self.seconds = seconds
+        self.maxsize = maxsize
+        self.cache = OrderedDict()  # {key: (stored_at, value)}
+        self.inflight = {}          # {key: threading.Event} for calls currently running
+        self.lock = threading.Lock()
+
+    def _lookup(self, key):
+        entry = self.cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.seconds:
+            self.cache.move_to_end(key)
+            return True, entry[1]
+        return False, None
+
+    def get(self, func, args, kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        while True:
+            with self.lock:
+                hit, value = self._lookup(key)
+                if hit:
+                    return value
+                event = self.inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = self.inflight[key] = threading.Event()
+
+            if leader:
+                break
+            event.wait()
+            with self.lock:
+                hit, value = self._lookup(key)
+            if hit:
+                return value
+            # the leading call failed; try again ourselves
+
+        try:
+            value = func(*args, **kwargs)
+            with self.lock:
+                self.cache[key] = (time.monotonic(), value)
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.maxsize:
+                    self.cache.popitem(last=False)
+            return value
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            event.set()
+
+    def invalidate(self):
+        with self.lock:
+            self.cache.clear()
+
+
+class _TTLCached:
+    """
+    Function wrapper returned by ttl_cache. On a method it keeps one store per instance (in the instance's
+    __dict__), so keys never hold `self` and .invalidate() only clears that instance's entries.
+    """
+
+    def __init__(self, func, seconds, maxsize):
+        update_wrapper(self, func)
+        self._seconds = seconds
+        self._maxsize = maxsize
+        self._store = _TTLStore(seconds, maxsize)
+        self._attr = f"_ttl_cache_{func.__name__}"
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        return self._store.get(self.__wrapped__, args, kwargs)
+
+    def invalidate(self):
+        self._store.invalidate()
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        store = instance.__dict__.get(self._attr)
+        if store is None:
+            with self._lock:
+                store = instance.__dict__.setdefault(self._attr, _TTLStore(self._seconds, self._maxsize))
+        method = self.__wrapped__.__get__(instance, owner)
+
+        @wraps(method)
+        def bound(*args, **kwargs):
+            return store.get(method, args, kwargs)
+
+        bound.invalidate = store.invalidate
+        return bound
+
+
+def ttl_cache(seconds=3, maxsize=128):
+    """
+    Memoize a function for `seconds`, keyed by its arguments and bounded to `maxsize` entries (LRU).
+    Concurrent misses on the same key are single-flighted: one caller runs the function, the rest wait for it.
+    The wrapped function gets an .invalidate() method that drops every cached entry; on methods the cache
+    (and .invalidate()) is per instance and `self` is not part of the key.
+    """
+    def decorator(func):
+        return _TTLCached(func, seconds, maxsize)
+
+    return decorator
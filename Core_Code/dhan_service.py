@@ -1,24 +1,31 @@
 import os
+import time
+import asyncio
+import threading
+from functools import lru_cache
 from dhanhq import dhanhq
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+from Core_Code.cache_utils import ttl_cache
 
 # -------------------------------
 # HELPER: Get Nearest Weekly Expiry
 # -------------------------------
+@lru_cache(maxsize=8)
+def _expiry_for_ordinal(day_ordinal):
+    today = date.fromordinal(day_ordinal)
+    # move forward to the next Thursday (3 = Thursday); 0 days when today is Thursday
+    days_ahead = (3 - today.weekday()) % 7
+    return (today + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
+
+
 def get_nearest_expiry():
     """
     Returns nearest Thursday expiry (weekly) for Nifty.
     """
-    today = datetime.now().date()
-    # move forward to the next Thursday (3 = Thursday)
-    days_ahead = (3 - today.weekday()) % 7 
-    if days_ahead == 0:  # If today is Thursday, keep today
-        expiry = today
-    else:
-        expiry = today + timedelta(days=days_ahead)
-    
-    return expiry.strftime("%Y-%m-%d")
+    return _expiry_for_ordinal(date.today().toordinal())
 
 
 class DhanService:
@@ -27,16 +34,18 @@ class DhanService:
         self.access_token = access_token
         self.access_key = access_key
         self.client = None
-        # Only attempt connection if all three required credentials are provided
-        if client_id and access_token and access_key:
+        self.ltp_feed = None   # DhanWebsocketFeed for subscribed option LTPs
+        self._feed_lock = threading.Lock()
+        # dhanhq v2 authenticates with client_id + access_token; access_key is kept only for older saved credentials
+        if client_id and access_token:
             self.connect()
 
     # -------------------------------
     # CONNECT TO DHAN
     # -------------------------------
     def connect(self):
-        # NOTE: Your existing project uses three arguments for dhanhq initialization
-        self.client = dhanhq(self.client_id, self.access_token, self.access_key)
+        # dhanhq>=2.0 takes (client_id, access_token); a third positional argument would be read as disable_ssl
+        self.client = dhanhq(self.client_id, self.access_token)
         return self.client
 
     # -------------------------------
@@ -53,6 +62,7 @@ class DhanService:
             price=price,
             order_type="LIMIT"
         )
+        self._invalidate_market_cache()
         return order.get("orderId")
 
     # -------------------------------
@@ -61,20 +71,110 @@ class DhanService:
     def exit_order(self, order_id):
         """Square off an open order."""
         if not self.client: return None
-        return self.client.cancel_order(order_id)
+        result = self.client.cancel_order(order_id)
+        self._invalidate_market_cache()
+        return result
+
+    # -------------------------------
+    # LTP FEED (WEBSOCKET)
+    # -------------------------------
+    def start_feed(self, identifiers):
+        """Stream LTPs for these NSE_FNO security ids; restarts the feed only when new ids are added."""
+        ids = {str(i) for i in identifiers if str(i).isdigit()}   # NSE-chain identifiers are not Dhan ids
+        if not self.client or not ids:
+            return None
+        with self._feed_lock:
+            feed = self.ltp_feed
+            if feed is not None and feed.is_alive() and ids <= {sid for _, sid, _ in feed.instruments}:
+                return feed
+            if feed is not None:
+                ids |= {sid for _, sid, _ in feed.instruments}
+                feed.stop()
+            self.ltp_feed = DhanWebsocketFeed(
+                self.client_id, self.access_token, [("NSE_FNO", sid, "Ticker") for sid in sorted(ids)]
+            ).start()
+            return self.ltp_feed
+
+    def stop_feed(self):
+        with self._feed_lock:
+            if self.ltp_feed is not None:
+                self.ltp_feed.stop()
+                self.ltp_feed = None
+
+    def _feed_ltp(self, identifier):
+        feed = self.ltp_feed
+        return feed.ltp(identifier) if feed is not None else None
 
     # -------------------------------
     # GET LTP
     # -------------------------------
     def get_ltp(self, identifier):
-        """Fetch latest LTP for a given instrument."""
-        if not self.client: return None
-        quote = self.client.get_quote(identifier)
-        return float(quote.get("ltp")) if quote and quote.get("ltp") else None
+        """Latest LTP for a given instrument: pushed feed value, REST quote until the feed has one."""
+        ltp = self._feed_ltp(identifier)
+        return ltp if ltp is not None else self._get_ltp_rest(identifier)
+
+    @ttl_cache(seconds=3)
+    def _get_ltp_rest(self, identifier):
+        if not self.client or not str(identifier).isdigit(): return None   # NSE-chain identifiers are not Dhan ids
+        quotes = self._market_quotes(self.client.ticker_data, "NSE_FNO", [identifier])
+        ltp = quotes.get(str(identifier), {}).get("last_price")
+        return float(ltp) if ltp else None
+
+    # -------------------------------
+    # GET LTP (BATCH)
+    # -------------------------------
+    def get_ltp_batch(self, identifiers):
+        """Fetch LTPs for several NSE_FNO instruments (feed first, one quote call for the rest). Returns {identifier: ltp}."""
+        if not self.client or not identifiers: return {}
+        ltps = {}
+        for identifier in identifiers:
+            ltp = self._feed_ltp(identifier)
+            if ltp is not None:
+                ltps[str(identifier)] = ltp
+        # NSE-chain identifiers are not Dhan ids; skip them like start_feed does
+        missing = [i for i in identifiers if str(i) not in ltps and str(i).isdigit()]
+        if not missing:
+            return ltps
+
+        for security_id, quote in self._market_quotes(self.client.quote_data, "NSE_FNO", missing).items():
+            ltp = quote.get("last_price")
+            if ltp:
+                ltps[str(security_id)] = float(ltp)
+        return ltps
+
+    # -------------------------------
+    # GET NIFTY QUOTE
+    # -------------------------------
+    @ttl_cache(seconds=3)
+    def get_index_quote(self, security_id=13):
+        """OHLC/LTP quote for an index (NIFTY 50 by default) from the v2 market-quote API, or {} on failure."""
+        if not self.client: return {}
+        quote = self._market_quotes(self.client.quote_data, "IDX_I", [security_id]).get(str(security_id))
+        if not quote:
+            return {}
+        ohlc = quote.get("ohlc", {})
+        return {
+            "open": ohlc.get("open", 0),
+            "high": ohlc.get("high", 0),
+            "low": ohlc.get("low", 0),
+            "ltp": quote.get("last_price", 0),
+            "volume": quote.get("volume", 0),
+        }
+
+    @staticmethod
+    def _market_quotes(api_call, segment, security_ids):
+        """Call a dhanhq v2 market-quote endpoint (quote_data/ticker_data) and return {security_id: quote} for one segment."""
+        resp = api_call({segment: [int(i) for i in security_ids]})
+        if not resp or resp.get("status") != "success":
+            raise ValueError(f"Market quote failed: {resp.get('remarks') if resp else 'no response'}")
+        data = resp.get("data", {})
+        data = data.get("data", data)  # SDK wraps the API body in a second "data" envelope
+        return {str(k): v for k, v in data.get(segment, {}).items()}
 
     # -------------------------------
     # GET OPTION CHAIN (NEW LOGIC)
     # -------------------------------
+    @ttl_cache(seconds=3)
     def get_option_chain(self):
         """
         Fetch option chain for Nifty 50 from Dhan API.
@@ -96,30 +196,51 @@ class DhanService:
                 expiry=expiry_date
             )
 
-            rows = []
             if resp and resp.get("status") == "success":
                 oc_data = resp.get("data", {}).get("oc", {})
+                n = len(oc_data)
 
-                for strike_str, data in oc_data.items():
-                    strike = float(strike_str)
+                # Column-wise buffers: one array per output column, filled in a single pass.
+                # OI counts as int64 (NIFTY OI can pass 2**31-1); bids stay float64 since they are sent back as order prices.
+                strikes = np.empty(n, dtype=float)
+                call_oi = np.empty(n, dtype=np.int64)
+                put_oi = np.empty(n, dtype=np.int64)
+                call_oi_diff = np.empty(n, dtype=np.int64)
+                put_oi_diff = np.empty(n, dtype=np.int64)
+                call_bid = np.empty(n, dtype=float)
+                put_bid = np.empty(n, dtype=float)
+                ident_ce = np.empty(n, dtype=object)
+                ident_pe = np.empty(n, dtype=object)
+
+                for i, (strike_str, data) in enumerate(oc_data.items()):
                     ce = data.get("ce", {})
                     pe = data.get("pe", {})
 
-                    rows.append({
-                        "strike": strike,
-                        # Mapping Dhan keys to your required DataFrame columns
-                        "Call_ODIN": ce.get("oi", 0),
-                        "PUT_ODIN": pe.get("oi", 0),
-                        "Call_OI_Diff": ce.get("changeInOi", 0), 
-                        "PUT_OI_DIFF": pe.get("changeInOi", 0), 
-                        "CALL_value_Bid": ce.get("bidPrice", 0),
-                        "put_value_Bid": pe.get("bidPrice", 0),
-                        "identifier_CE": ce.get("securityId"), 
-                        "identifier_PE": pe.get("securityId"), 
-                    })
-
-                if rows:
-                    df = pd.DataFrame(rows).set_index("strike")
+                    strikes[i] = float(strike_str)
+                    # Mapping Dhan keys to your required DataFrame columns
+                    call_oi[i] = ce.get("oi") or 0
+                    put_oi[i] = pe.get("oi") or 0
+                    call_oi_diff[i] = ce.get("changeInOi") or 0
+                    put_oi_diff[i] = pe.get("changeInOi") or 0
+                    call_bid[i] = ce.get("bidPrice") or 0
+                    put_bid[i] = pe.get("bidPrice") or 0
+                    ident_ce[i] = ce.get("securityId")
+                    ident_pe[i] = pe.get("securityId")
+
+                if n:
+                    df = pd.DataFrame(
+                        {
+                            "Call_ODIN": call_oi,
+                            "PUT_ODIN": put_oi,
+                            "Call_OI_Diff": call_oi_diff,
+                            "PUT_OI_DIFF": put_oi_diff,
+                            "CALL_value_Bid": call_bid,
+                            "put_value_Bid": put_bid,
+                            "identifier_CE": ident_ce,
+                            "identifier_PE": ident_pe,
+                        },
+                        index=pd.Index(strikes, name="strike"),
+                    )
                     df["time_stamp"] = resp.get("data", {}).get("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
                     df["underlyingValue"] = resp.get("data", {}).get("spotPrice", None)
                     return df
@@ -127,4 +248,86 @@ class DhanService:
         except Exception as e:
             print(f"[DhanService] Option chain fetch failed: {e}")
         
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+    # -------------------------------
+    # CACHE INVALIDATION
+    # -------------------------------
+    def _invalidate_market_cache(self):
+        """Force fresh LTP / option-chain reads after an order changes state."""
+        self._get_ltp_rest.invalidate()
+        self.get_index_quote.invalidate()
+        self.get_option_chain.invalidate()
+
+
+# -------------------------------
+# MARKET FEED (WEBSOCKET PUSH)
+# -------------------------------
+class DhanWebsocketFeed:
+    """
+    Background Dhan market feed (defaults to the NIFTY 50 index quote).
+    Keeps the latest pushed packet per security so callers read it instead of polling REST; reconnects with backoff.
+    Instruments are (segment, security_id, mode) names from dhanhq.marketfeed, e.g. ("NSE_FNO", "43519", "Ticker").
+    """
+    NIFTY_SECURITY_ID = "13"
+
+    def __init__(self, client_id, access_token, instruments=None):
+        self.client_id = client_id
+        self.access_token = access_token
+        self.instruments = instruments or [("IDX", self.NIFTY_SECURITY_ID, "Quote")]
+        self.packets = {}           # {security_id: (time.monotonic() on arrival, packet {LTP, open, high, ...})}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def quote(self, max_age=60, security_id=NIFTY_SECURITY_ID):
+        """Latest pushed packet, or None if the feed is down or nothing arrived within `max_age` seconds."""
+        entry = self.packets.get(str(security_id))
+        if entry is None or time.monotonic() - entry[0] > max_age:
+            return None
+        return entry[1]
+
+    def ltp(self, security_id, max_age=60):
+        packet = self.quote(max_age, security_id)
+        return float(packet["LTP"]) if packet else None
+
+    def _run(self):
+        from dhanhq import marketfeed
+
+        asyncio.set_event_loop(asyncio.new_event_loop())   # DhanFeed drives its socket on this thread's loop
+        instruments = [(getattr(marketfeed, segment), str(security_id), getattr(marketfeed, mode))
+                       for segment, security_id, mode in self.instruments]
+        backoff = 1
+        while not self._stop.is_set():
+            feed = None
+            try:
+                feed = marketfeed.DhanFeed(self.client_id, self.access_token, instruments, "v2")
+                while not self._stop.is_set():
+                    feed.run_forever()
+                    packet = feed.get_data()
+                    if packet and "LTP" in packet:
+                        self.packets[str(packet.get("security_id"))] = (time.monotonic(), packet)
+                        backoff = 1
+            except Exception as e:
+                print(f"[DhanWebsocketFeed] Feed error, reconnecting in {backoff}s: {e}")
+                if self._stop.wait(backoff):
+                    break
+                backoff = min(backoff * 2, 60)
+            finally:
+                if feed is not None:
+                    try:
+                        feed.disconnect()
+                    except Exception:
+                        pass
@@ -1,15 +1,25 @@
 import requests
 import pandas as pd
 import numpy as np
+import os
 import time
 import json
+import threading
 import requests
 import pandas as pd
 from datetime import datetime, timedelta
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from io import StringIO
 import httpx
+import ijson
+import orjson
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from Core_Code.cache_utils import ttl_cache
+
+try:
+    _ijson = ijson.get_backend("yajl2_c")  # C backend when available
+except ImportError:
+    _ijson = ijson
 
 # ------------------------------
 # Headers (mimic real browser)
@@ -26,7 +36,6 @@ def get_adjusted_headers(mount_url):
         'Accept-Encoding': 'gzip, deflate, br',
         'Accept-Language': 'en-US,en;q=0.9',
         'Cache-Control': 'max-age=0',
-        'Connection': 'keep-alive',
         'DNT': '1',
         'Referer': mount_url,
         'Sec-Ch-Ua': '"Not_A Brand";v="8", "Chromium";v="120", "Microsoft Edge";v="120"',
@@ -39,118 +48,273 @@ def get_adjusted_headers(mount_url):
     }
 
 
+# ------------------------------
+# Shared HTTP/2 client (one TLS connection reused across NSE calls)
+# ------------------------------
+_NSE_CLIENT = httpx.Client(
+    http2=True,
+    timeout=120.0,
+    transport=httpx.HTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+    ),
+)
+
+
 # ------------------------------
 # Fetch cookies (mimic browser session)
 # ------------------------------
-def fetch_cookies(mount_url):
+COOKIE_TTL = 60  # seconds; NSE session cookies stay valid for several minutes
+
+_COOKIE_CACHE = {}  # {mount_url: (fetched_at, cookies)}
+_COOKIE_LOCK = threading.Lock()
+
+
+def _request_cookies(mount_url, retry=True):
     while True:
         try:
-            session = requests.Session()
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=5,
-                status_forcelist=[429, 500, 502, 503, 504],
-            )
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            session.mount('https://', adapter)
-            session.mount('http://', adapter)
-
-            response = session.get(mount_url, timeout=90, headers=get_adjusted_headers(mount_url))
+            response = _NSE_CLIENT.get(mount_url, timeout=90, headers=get_adjusted_headers(mount_url))
 
             if response.status_code != requests.codes.ok:
                 raise ValueError(f"Request failed with status code {response.status_code}. Please try again in a minute.")
 
-            return response.cookies.get_dict()
+            return dict(response.cookies)   # the shared client's jar keeps them for later calls
 
         except Exception as e:
+            if not retry:
+                raise
             print(f"An error occurred in fetch_cookies: {e} " + datetime.now().time().strftime("%H:%M:%S"))
             time.sleep(60)
             continue
 
 
+def fetch_cookies(mount_url, retry=True):
+    """
+    Prime the shared client's cookie jar from mount_url, at most once per COOKIE_TTL seconds.
+    Returns the session cookies (pass them back to invalidate_cookies); retry=False raises instead of waiting.
+    """
+    with _COOKIE_LOCK:
+        cached = _COOKIE_CACHE.get(mount_url)
+        if cached and time.time() - cached[0] < COOKIE_TTL:
+            return cached[1]
+
+    cookies = _request_cookies(mount_url, retry)
+    with _COOKIE_LOCK:
+        _COOKIE_CACHE[mount_url] = (time.time(), cookies)
+    return cookies
+
+
+def invalidate_cookies(mount_url, cookies=None):
+    """Expire the NSE session (only if mount_url was still primed with `cookies`, when given) so the next call re-primes."""
+    with _COOKIE_LOCK:
+        cached = _COOKIE_CACHE.get(mount_url)
+        if cached and (cookies is None or cached[1] == cookies):
+            # One jar serves every mount_url, so clearing it expires all primed sessions
+            _NSE_CLIENT.cookies.clear()
+            _COOKIE_CACHE.clear()
+
+
 # ------------------------------
 # Fetch historical Nifty data
 # ------------------------------
+def _stream_hist_records(mount_url, url):
+    """
+    Stream the indicesHistory response through ijson (one tokenizing pass over the body).
+    Returns (status_code, close_records, turnover_records); records are None on non-200.
+    """
+    with _NSE_CLIENT.stream("GET", url, headers=get_adjusted_headers(mount_url)) as response:
+        if response.status_code != requests.codes.ok:
+            return response.status_code, None, None
+
+        # One parser, its events fanned out to two item builders: only the records themselves are materialized
+        close_records, turnover_records = ijson.sendable_list(), ijson.sendable_list()
+        parse_coro = _ijson.parse_coro(_fan_out(
+            ijson.common.items_basecoro(close_records, 'data.indexCloseOnlineRecords.item'),
+            ijson.common.items_basecoro(turnover_records, 'data.indexTurnoverRecords.item'),
+        ), use_float=True)
+        for chunk in response.iter_bytes():
+            parse_coro.send(chunk)
+        parse_coro.close()
+
+        return response.status_code, close_records, turnover_records
+
+
+@ijson.coroutine
+def _fan_out(*targets):
+    """Forward each (prefix, event, value) parse event to every target coroutine."""
+    while True:
+        event = (yield)
+        for target in targets:
+            target.send(event)
+
+
+_HIST_CLOSE_COLS = ['EOD_INDEX_NAME', 'EOD_OPEN_INDEX_VAL', 'EOD_HIGH_INDEX_VAL',
+                    'EOD_LOW_INDEX_VAL', 'EOD_CLOSE_INDEX_VAL']
+
+
 def fetch_url_hist_nifty(mount_url, url, cookies3):
     try:
-        
-        with httpx.Client(
-            http2=False, # FIX: Set to False for stability on your environment
-            timeout=120.0, 
-            headers=get_adjusted_headers(mount_url), 
-            cookies=cookies3
-        ) as client:
-            response = client.get(url)
-             
-        
-        #client = httpx.Client(http2=True, timeout=120.0, headers=get_adjusted_headers(mount_url), cookies=cookies3)
-        #response = client.get(url)
-        #client.close() # Manually close the client to release resources
+        status, close_records, turnover_records = _stream_hist_records(mount_url, url)
 
+        # Expired session: refresh cookies once and retry
+        if status in (401, 403):
+            invalidate_cookies(mount_url, cookies3)
+            fetch_cookies(mount_url)
+            status, close_records, turnover_records = _stream_hist_records(mount_url, url)
 
-        #session = requests.session()
-        #session.mount(mount_url, HTTP20Adapter())  # ✅ HTTP/2 adapter from hyper
-        #response = session.get(url, timeout=120, headers=get_adjusted_headers(mount_url), cookies=cookies3)
+        if status == requests.codes.ok:
+            if not close_records or not turnover_records:
+                # Valid response for a window with no sessions (e.g. only holidays)
+                return pd.DataFrame(columns=['EOD_TIMESTAMP', *_HIST_CLOSE_COLS, 'HIT_TRADED_QTY'])
 
-        if response.status_code == requests.codes.ok:
-            data = response.json()
+            # Keep only the OHLC columns up front so concat doesn't carry _id/TIMESTAMP/EOD_* extras
+            p1 = pd.DataFrame(close_records).set_index('EOD_TIMESTAMP')[_HIST_CLOSE_COLS]
+            p1.index = pd.to_datetime(p1.index, format="%d-%b-%Y", cache=True)
 
-            p1 = pd.DataFrame(data['data']['indexCloseOnlineRecords']).set_index('EOD_TIMESTAMP')
-            p1.index = pd.to_datetime(p1.index, format="%d-%b-%Y")
-
-            p2 = pd.DataFrame(data['data']["indexTurnoverRecords"]).set_index('HIT_TIMESTAMP')
-            p2.index = pd.to_datetime(p2.index, format="%d-%m-%Y")
+            p2 = pd.DataFrame(turnover_records).set_index('HIT_TIMESTAMP')
+            p2.index = pd.to_datetime(p2.index, format="%d-%m-%Y", cache=True)
             p2.index.name = 'EOD_TIMESTAMP'
 
-            result = p1.join(p2[['HIT_TRADED_QTY', 'HIT_TURN_OVER']],
-                             lsuffix='_left', rsuffix='_right', how='inner')
+            # Both sides are daily and already (near-)sorted; align on the sorted DatetimeIndex
+            p1 = p1.sort_index()
+            p2 = p2.sort_index()
+            result = p1.merge(p2[['HIT_TRADED_QTY']],
+                              left_index=True, right_index=True, how='inner', sort=False)
 
             return result.reset_index()
         else:
-            print("Response not received in fetch_url_hist_nifty =>", response.status_code)
-            return pd.DataFrame()
+            print("Response not received in fetch_url_hist_nifty =>", status)
+            return None
 
     except Exception as e:
         print(f"An error occurred in fetch_url_hist_nifty: {e} " + datetime.now().time().strftime("%H:%M:%S"))
         time.sleep(60)
-        return pd.DataFrame()
+        return None
+
+
+# ------------------------------
+# Persistent history cache (closed EOD days never change)
+# ------------------------------
+HIST_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "assets", "nifty_hist_cache.parquet")
+HIST_RANGES_PATH = HIST_CACHE_PATH.replace(".parquet", ".ranges.json")  # [from, to] date ranges fully fetched
+_HIST_CACHE_LOCK = threading.Lock()
+HIST_FETCH_WORKERS = 4  # concurrent yearly windows; NSE throttles wider bursts from one session
+
+
+def _load_hist_cache():
+    """Raw merged history rows stored by earlier runs and the date ranges they cover, or (None, [])."""
+    if not os.path.exists(HIST_CACHE_PATH) or not os.path.exists(HIST_RANGES_PATH):
+        return None, []
+    try:
+        with open(HIST_RANGES_PATH, "r") as f:
+            ranges = [(datetime.strptime(lo, "%Y-%m-%d").date(), datetime.strptime(hi, "%Y-%m-%d").date())
+                      for lo, hi in json.load(f)]
+        return pd.read_parquet(HIST_CACHE_PATH), ranges
+    except Exception as e:
+        print(f"[nse_data_fetch] Ignoring unreadable history cache: {e}")
+        return None, []
+
+
+def _save_hist_cache(df, ranges):
+    """Write rows, then the ranges they cover; ranges are only advanced once the rows are on disk."""
+    with _HIST_CACHE_LOCK:
+        try:
+            os.makedirs(os.path.dirname(HIST_CACHE_PATH), exist_ok=True)
+            tmp_path = HIST_CACHE_PATH + ".tmp"
+            df.to_parquet(tmp_path, compression="zstd", index=False)
+            os.replace(tmp_path, HIST_CACHE_PATH)
+
+            tmp_path = HIST_RANGES_PATH + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump([[lo.isoformat(), hi.isoformat()] for lo, hi in ranges], f)
+            os.replace(tmp_path, HIST_RANGES_PATH)
+        except Exception as e:
+            print(f"[nse_data_fetch] History cache write failed: {e}")
+
+
+def _merge_ranges(ranges):
+    """Sort and merge overlapping/adjacent (from, to) date ranges."""
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + timedelta(1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def _missing_windows(start, end, covered, span=365):
+    """(from, to) windows of at most `span` days covering [start, end] minus the covered ranges, newest first."""
+    gaps = []
+    cursor = start
+    for lo, hi in _merge_ranges(covered):
+        if hi < cursor or lo > end:
+            continue
+        if lo > cursor:
+            gaps.append((cursor, lo - timedelta(1)))
+        cursor = max(cursor, hi + timedelta(1))
+    if cursor <= end:
+        gaps.append((cursor, end))
+
+    windows = []
+    for lo, hi in reversed(gaps):
+        while hi >= lo:
+            window_lo = max(lo, hi - timedelta(span))
+            windows.append((window_lo, hi))
+            hi = window_lo - timedelta(1)
+    return windows
 
 
 # ------------------------------
 # Orchestrator for fetching all years
 # ------------------------------
 def get_nifty_hist_data():
-    nifty_hist_data = pd.DataFrame()
-    first_day = datetime.date(datetime.now())
+    today = datetime.date(datetime.now())
     cutoff_date = datetime.strptime("14-Jan-2021", "%d-%b-%Y").date()
-    i = 0
-    J = first_day.year - cutoff_date.year + 1
     mount_url = 'https://www.nseindia.com/reports-indices-historical-index-data'
 
-    while i < J:
-        if first_day < cutoff_date:
-            break
-        last_day = first_day - timedelta(365)
-
-        if last_day < cutoff_date:
-            last_day = cutoff_date
+    # Only fetch the date ranges no earlier run has fully fetched; windows are independent, so fetch in parallel
+    cached, covered = _load_hist_cache()
+    windows = _missing_windows(cutoff_date, today, covered)
 
+    results = {}
+    if windows:
         cookies3 = fetch_cookies(mount_url)
-        url_hist_nifty = (
-            f"https://www.nseindia.com/api/historical/indicesHistory?"
-            f"indexType=NIFTY%2050&from={last_day.strftime('%d-%m-%Y')}&to={first_day.strftime('%d-%m-%Y')}"
-        )
+        with ThreadPoolExecutor(max_workers=HIST_FETCH_WORKERS) as executor:
+            futures = {
+                executor.submit(
+                    fetch_url_hist_nifty,
+                    mount_url,
+                    f"https://www.nseindia.com/api/historical/indicesHistory?"
+                    f"indexType=NIFTY%2050&from={last_day.strftime('%d-%m-%Y')}&to={first_day.strftime('%d-%m-%Y')}",
+                    cookies3,
+                ): (last_day, first_day)
+                for last_day, first_day in windows
+            }
+            results = {futures[future]: future.result() for future in as_completed(futures)}
+
+    # Failed windows come back as None: they stay uncovered and are refetched on the next call.
+    # Today's EOD row is not final until the close, so coverage stops at yesterday.
+    fetched_ok = {window: frame for window, frame in results.items() if frame is not None}
+    closed_day = today - timedelta(1)
+    new_ranges = [(lo, min(hi, closed_day)) for lo, hi in fetched_ok if lo <= closed_day]
+
+    frames = [frame for frame in fetched_ok.values() if not frame.empty]
+    if cached is not None and not cached.empty:
+        frames.insert(0, cached)
+    if not frames:
+        return pd.DataFrame(columns=['index', 'Open', 'High', 'Low', 'Close', 'Volume', 'EOD_TIMESTAMP'])
 
-        temp_data = fetch_url_hist_nifty(mount_url, url_hist_nifty, cookies3)
-        nifty_hist_data = pd.concat([nifty_hist_data, temp_data], ignore_index=True)
+    raw = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if fetched_ok:
+        raw = raw.drop_duplicates(subset='EOD_TIMESTAMP', keep='last')
+        _save_hist_cache(raw, _merge_ranges(covered + new_ranges))
 
-        first_day = first_day - timedelta(365)
-        i += 1
+    nifty_hist_data = raw
 
-    if nifty_hist_data.empty:
-        return pd.DataFrame(columns=['index', 'Open', 'High', 'Low', 'Close', 'Volume', 'EOD_TIMESTAMP'])
-
-    nifty_hist_data['EOD_TIMESTAMP'] = pd.to_datetime(nifty_hist_data['EOD_TIMESTAMP'], format='%d-%m-%Y')
+    # EOD_TIMESTAMP is already datetime64 (parsed per chunk for the join)
     nifty_hist_data = nifty_hist_data.sort_values(by='EOD_TIMESTAMP', ascending=True)
 
     nifty_hist_data = nifty_hist_data.rename(columns={
@@ -162,16 +326,18 @@ def get_nifty_hist_data():
         'HIT_TRADED_QTY': 'Volume'
     })
 
-    # Replace 0 with rolling mean
-    nifty_hist_data["Volume"] = nifty_hist_data["Volume"].replace(0, np.NaN)
-    nifty_hist_data["Volume"] = nifty_hist_data["Volume"].fillna(
-        nifty_hist_data["Volume"].rolling(3).mean().shift().ffill()
-    )
-
-    # Drop extra cols
-    for col in ['TIMESTAMP', '_id']:
-        if col in nifty_hist_data.columns:
-            nifty_hist_data.drop(col, axis=1, inplace=True)
+    # Replace 0 with the previous rows' 3-day rolling mean (forward-filled), in one NumPy pass
+    volume = nifty_hist_data["Volume"].to_numpy(dtype=np.float64, copy=True)
+    volume[volume == 0] = np.nan
+    fill = np.full(len(volume), np.nan)
+    if len(volume) >= 3:
+        fill[3:] = np.convolve(volume, np.ones(3) / 3, mode="valid")[:-1]
+    last_valid = np.where(np.isnan(fill), 0, np.arange(len(fill)))
+    np.maximum.accumulate(last_valid, out=last_valid)
+    fill = fill[last_valid]
+    missing = np.isnan(volume)
+    volume[missing] = fill[missing]
+    nifty_hist_data["Volume"] = volume
 
     return nifty_hist_data
 
@@ -179,7 +345,12 @@ def get_nifty_hist_data():
 # ------------------------------
 # Real-Time Option Chain Fetch
 # ------------------------------
+_OC_COLS = (
+    "strike", "Call_ODIN", "PUT_ODIN", "Call_OI_Diff", "PUT_OI_DIFF",
+    "CALL_value_Bid", "put_value_Bid", "identifier_CE", "identifier_PE",
+)
 
+@ttl_cache(seconds=5)
 def get_option_data_from_nse():
     """
     Fallback: Fetch Nifty option chain from NSE public API
@@ -194,53 +365,39 @@ def get_option_data_from_nse():
         api_url = "https://www.nseindia.com/api/option-chain-indices?symbol=NIFTY"
         
         # Ensure headers use the correct priming URL as the Referer
-        headers = get_adjusted_headers(base_url) 
-        
-        # Initialize httpx Client
-        with httpx.Client(
-            http2=False, # Stable connection
-            timeout=30.0, 
-            headers=headers
-        ) as client:
-            
-            # 3. Session Priming: Hit the base_url to establish the authorized session (Fixes 404/401)
-            r_prime = client.get(base_url)
-            r_prime.raise_for_status() 
-            
-            # 4. API Fetch: Use the same client for the API call
-            r = client.get(api_url)
-            r.raise_for_status()
-            data = r.json()
-
+        headers = get_adjusted_headers(base_url)
 
-        #session = requests.Session()
-        #headers = get_adjusted_headers("https://www.nseindia.com")
-        #cookies = fetch_cookies("https://www.nseindia.com")
+        # 3. Session Priming: cookies from base_url, cached for COOKIE_TTL and shared with the other NSE calls
+        cookies = fetch_cookies(base_url, retry=False)
 
-        #url = "https://www.nseindia.com/api/option-chain-indices?symbol=NIFTY"
-        #r = session.get(url, headers=headers, cookies=cookies, timeout=30)
-        #r.raise_for_status()
-        #data = r.json()
+        # 4. API Fetch over the shared pooled client (its jar carries the cookies); an expired session is re-primed once
+        r = _NSE_CLIENT.get(api_url, timeout=30.0, headers=headers)
+        if r.status_code in (401, 403):
+            invalidate_cookies(base_url, cookies)
+            fetch_cookies(base_url, retry=False)
+            r = _NSE_CLIENT.get(api_url, timeout=30.0, headers=headers)
+        r.raise_for_status()
+        data = orjson.loads(r.content)
 
         rows = []
         for item in data.get("records", {}).get("data", []):
-            strike = item.get("strikePrice")
             ce = item.get("CE", {})
             pe = item.get("PE", {})
 
-            rows.append({
-                "strike": strike,
-                "Call_ODIN": ce.get("openInterest", 0),
-                "PUT_ODIN": pe.get("openInterest", 0),
-                "Call_OI_Diff": ce.get("changeinOpenInterest", 0),
-                "PUT_OI_DIFF": pe.get("changeinOpenInterest", 0),
-                "CALL_value_Bid": ce.get("bidprice"),
-                "put_value_Bid": pe.get("bidprice"),
-                "identifier_CE": ce.get("identifier"),
-                "identifier_PE": pe.get("identifier"),
-            })
-
-        df = pd.DataFrame(rows).set_index("strike")
+            # Tuple order must match _OC_COLS
+            rows.append((
+                item.get("strikePrice"),
+                ce.get("openInterest", 0),
+                pe.get("openInterest", 0),
+                ce.get("changeinOpenInterest", 0),
+                pe.get("changeinOpenInterest", 0),
+                ce.get("bidprice"),
+                pe.get("bidprice"),
+                ce.get("identifier"),
+                pe.get("identifier"),
+            ))
+
+        df = pd.DataFrame.from_records(rows, columns=_OC_COLS).set_index("strike")
         df["time_stamp"] = data.get("records", {}).get("timestamp", "")
         df["underlyingValue"] = data.get("records", {}).get("underlyingValue", None)
         return df
@@ -251,21 +408,14 @@ def get_option_data_from_nse():
     
 
 # ---- 2. Fallback → NSE API ----
-def fetch_url_nifty(mount_url, url, cookies2):
+def fetch_url_nifty(mount_url, url):
     """
-    Fetch data from NSE URL using httpx (HTTP/1.1 for stability).
+    Fetch data from NSE URL over the shared pooled httpx client.
     Retries every 60 seconds on failure.
     """
     while True:
         try:
-            # Create a client session with headers + cookies
-            with httpx.Client(
-                http2=False,   # keep HTTP/1.1 (NSE sometimes rejects http2)
-                timeout=90.0,
-                headers=get_adjusted_headers(mount_url),
-                cookies=cookies2
-            ) as client:
-                response = client.get(url)
+            response = _NSE_CLIENT.get(url, timeout=90.0, headers=get_adjusted_headers(mount_url))
 
             if response.status_code == 200:
                 return response
@@ -287,8 +437,8 @@ def get_nifty_live_nse():
             #url_nifty = "https://www.nseindia.com/api/equity-stockIndices?csv=true&index=NIFTY%2050"
             url_nifty = "https://www.nseindia.com/api/equity-stockIndices?csv=true&index=NIFTY%2050&selectValFormat=crores"
             mount_url='https://www.nseindia.com/market-data/live-equity-market'
-            cookies2 = fetch_cookies(mount_url)
-            nifty_live_data = pd.read_csv(StringIO(fetch_url_nifty(mount_url,url_nifty, cookies2).content.decode('utf-8')))
+            fetch_cookies(mount_url)
+            nifty_live_data = pd.read_csv(StringIO(fetch_url_nifty(mount_url, url_nifty).content.decode('utf-8')))
             
             df_temp = nifty_live_data.head(1).assign(load_time=datetime.now().strftime('%H:%M'))
             df_temp['Date'] = datetime.now().strftime('%d-%m-%Y')
@@ -1,8 +1,10 @@
 import os
-import pandas as pd
+import csv
+import asyncio
 import threading
-import time
+from dataclasses import asdict, dataclass
 from datetime import datetime
+from typing import Optional
 
 from Core_Code.nse_data_fetch import get_option_data_from_nse   # fallback for paper trades
 
@@ -12,6 +14,37 @@ ASSETS_DIR = os.path.join(BASE_DIR, "assets")
 os.makedirs(ASSETS_DIR, exist_ok=True)
 
 TRADE_LOG_PATH = os.path.join(ASSETS_DIR, "paper_trades.csv")
+# Trade attribute -> trade log column (CSV header order)
+TRADE_LOG_COLUMNS = {
+    "mode": "Mode", "date": "Date", "entry_time": "Entry Time", "exit_time": "Exit Time",
+    "option": "Option", "type": "Type", "qty": "Qty", "entry_price": "Entry Price",
+    "exit_price": "Exit Price", "pl": "P/L", "identifier": "Identifier", "order_id": "OrderID",
+    "strike_price": "StrikePrice", "dynamic_stop": "DynamicStop",
+}
+TRADE_LOG_FIELDS = list(TRADE_LOG_COLUMNS.values())
+
+MONITOR_INTERVAL = 60  # seconds between TP/SL checks
+
+
+@dataclass(slots=True)
+class Trade:
+    mode: str
+    date: str
+    entry_time: str
+    option: str
+    type: str
+    qty: int
+    entry_price: float
+    identifier: str
+    strike_price: float
+    order_id: Optional[str] = None
+    exit_time: Optional[str] = None
+    exit_price: Optional[float] = None
+    pl: Optional[float] = None
+    dynamic_stop: float = -6.0   # ✅ start stop-loss at -6%
+
+    def to_log_row(self):
+        return {TRADE_LOG_COLUMNS[k]: v for k, v in asdict(self).items()}
 
 
 class OrderManager:
@@ -20,8 +53,13 @@ class OrderManager:
         :param dhan: DhanService instance (must expose place_order, exit_order, get_ltp)
         """
         self.dhan = dhan
-        self.open_trades = {}  # active trades {identifier: trade dict}
+        self.open_trades = {}  # active trades {identifier: Trade}
+        self.order_flag = threading.Event()  # set once the day's entry is placed; cleared at square-off
         self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._monitor_thread = None
+        self._log_file = None     # trade log handle, opened on first closed trade
+        self._log_writer = None
 
     # -------------------------------
     # PAPER TRADE
@@ -29,27 +67,23 @@ class OrderManager:
     def paper_trade(self, identifier, qty, option_type, strike_price, entry_price):
         entry_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        trade = {
-            "Mode": "PAPER",
-            "Date": entry_time.split()[0],
-            "Entry Time": entry_time,
-            "Exit Time": None,
-            "Option": f"{strike_price} {option_type}",
-            "Type": option_type.upper(),
-            "Qty": qty,
-            "Entry Price": float(entry_price),
-            "Exit Price": None,
-            "P/L": None,
-            "Identifier": str(identifier),
-            "OrderID": None,
-            "StrikePrice": strike_price,
-            "DynamicStop": -6.0,   # ✅ start stop-loss at -6%
-        }
+        trade = Trade(
+            mode="PAPER",
+            date=entry_time.split()[0],
+            entry_time=entry_time,
+            option=f"{strike_price} {option_type}",
+            type=option_type.upper(),
+            qty=qty,
+            entry_price=float(entry_price),
+            identifier=str(identifier),
+            strike_price=strike_price,
+            order_id=None,
+        )
 
         with self._lock:
             self.open_trades[str(identifier)] = trade
 
-        threading.Thread(target=self._monitor_trade, args=(str(identifier),), daemon=True).start()
+        self._start_monitor()
         return trade
 
     # -------------------------------
@@ -63,79 +97,118 @@ class OrderManager:
         order_id = self.dhan.place_order(identifier, qty, option_type, strike_price, entry_price)
 
         entry_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        trade = {
-            "Mode": "LIVE",
-            "Date": entry_time.split()[0],
-            "Entry Time": entry_time,
-            "Exit Time": None,
-            "Option": f"{strike_price} {option_type}",
-            "Type": option_type.upper(),
-            "Qty": qty,
-            "Entry Price": float(entry_price),
-            "Exit Price": None,
-            "P/L": None,
-            "Identifier": str(identifier),
-            "OrderID": order_id,
-            "StrikePrice": strike_price,
-            "DynamicStop": -6.0,   # ✅ start stop-loss at -6%
-        }
+        trade = Trade(
+            mode="LIVE",
+            date=entry_time.split()[0],
+            entry_time=entry_time,
+            option=f"{strike_price} {option_type}",
+            type=option_type.upper(),
+            qty=qty,
+            entry_price=float(entry_price),
+            identifier=str(identifier),
+            strike_price=strike_price,
+            order_id=order_id,
+        )
 
         with self._lock:
             self.open_trades[str(identifier)] = trade
 
-        threading.Thread(target=self._monitor_trade, args=(str(identifier),), daemon=True).start()
+        self._start_monitor()
         return trade
 
     # -------------------------------
     # MONITOR TP/SL with Trailing Stop
     # -------------------------------
-    def _monitor_trade(self, identifier):
-        """Check every minute for +13% profit or dynamic trailing stop"""
+    def _start_monitor(self):
+        """Start the shared monitor thread if it is not running and wake it for an immediate check."""
+        with self._lock:
+            if self._monitor_thread is None:
+                self._monitor_thread = threading.Thread(target=self._monitor_trades, daemon=True)
+                self._monitor_thread.start()
+            identifiers = list(self.open_trades)
+
+        # Subscribe open trades to the Dhan LTP feed so the monitor reads pushed prices
+        if self.dhan:
+            try:
+                self.dhan.start_feed(identifiers)
+            except Exception as e:
+                print(f"[Monitor] LTP feed subscribe failed, polling quotes instead: {e}")
+        self._wake.set()
+
+    def _monitor_trades(self):
+        """Monitor thread entry point: runs the async monitor loop on this one thread."""
+        asyncio.run(self._monitor_all())
+
+    async def _monitor_all(self):
+        """Single scheduler: check all open trades every minute for +13% profit or dynamic trailing stop"""
         while True:
             with self._lock:
-                if identifier not in self.open_trades:
-                    break
-                trade = self.open_trades[identifier]
+                if not self.open_trades:
+                    self._monitor_thread = None
+                    return
+                trades = dict(self.open_trades)
+            self._wake.clear()
 
-            ltp = None
-            try:
-                # Prefer Dhan LTP if available
-                if self.dhan:
-                    ltp = self.dhan.get_ltp(identifier)
+            ltps = await self._fetch_ltps(trades)
+            for identifier, trade in trades.items():
+                self._check_exit(identifier, trade, ltps.get(identifier))
+
+            await asyncio.to_thread(self._wake.wait, MONITOR_INTERVAL)
 
-                # Fallback to NSE option chain if no LTP from Dhan (esp. paper trades)
-                if not ltp:
-                    oi_df = get_option_data_from_nse()
-                    strike = trade["StrikePrice"]
-                    if trade["Type"] == "CALL" and strike in oi_df.index:
-                        ltp = oi_df.loc[strike, "CALL_value_Bid"]
-                    elif trade["Type"] == "PUT" and strike in oi_df.index:
-                        ltp = oi_df.loc[strike, "put_value_Bid"]
+    async def _fetch_ltps(self, trades):
+        """Fetch LTPs for all open trades in one round. Returns {identifier: ltp}."""
+        ltps = {}
 
+        # Prefer Dhan LTP if available: one batched quote call, per-trade quotes only if that fails
+        if self.dhan:
+            try:
+                ltps.update(await asyncio.to_thread(self.dhan.get_ltp_batch, list(trades)))
             except Exception as e:
-                print(f"[Monitor] Failed to fetch LTP for {identifier}: {e}")
-                time.sleep(60)
-                continue
+                print(f"[Monitor] Batch LTP fetch failed, falling back to per-trade quotes: {e}")
+                results = await asyncio.gather(*(self._poll_one(identifier) for identifier in trades))
+                ltps.update(zip(trades, results))
 
-            if not ltp or not trade["Entry Price"]:
-                time.sleep(60)
+        # Fallback to NSE option chain if no LTP from Dhan (esp. paper trades); scraped at most once per tick
+        oi_df = None
+        for identifier, trade in trades.items():
+            if ltps.get(identifier):
                 continue
+            try:
+                if oi_df is None:
+                    oi_df = await asyncio.to_thread(get_option_data_from_nse)
+                strike = trade.strike_price
+                if trade.type == "CALL" and strike in oi_df.index:
+                    ltps[identifier] = oi_df.loc[strike, "CALL_value_Bid"]
+                elif trade.type == "PUT" and strike in oi_df.index:
+                    ltps[identifier] = oi_df.loc[strike, "put_value_Bid"]
+            except Exception as e:
+                print(f"[Monitor] Failed to fetch LTP for {identifier}: {e}")
 
-            # % change from entry
-            change_pct = ((ltp - trade["Entry Price"]) / trade["Entry Price"]) * 100
+        return ltps
 
-            # ✅ Trailing stop adjustment
-            if change_pct > 0:
-                new_stop = -6.0 + change_pct+2
-                if new_stop > trade["DynamicStop"]:
-                    trade["DynamicStop"] = new_stop
+    async def _poll_one(self, identifier):
+        try:
+            return await asyncio.to_thread(self.dhan.get_ltp, identifier)
+        except Exception as e:
+            print(f"[Monitor] Failed to fetch LTP for {identifier}: {e}")
+            return None
 
-            # ✅ Exit rules
-            if change_pct >= 13 or change_pct <= trade["DynamicStop"]:
-                self.close_trade(identifier, ltp)
-                break
+    def _check_exit(self, identifier, trade, ltp):
+        if not ltp or not trade.entry_price:
+            return
 
-            time.sleep(60)
+        # % change from entry
+        change_pct = ((ltp - trade.entry_price) / trade.entry_price) * 100
+
+        # ✅ Trailing stop adjustment
+        if change_pct > 0:
+            new_stop = -6.0 + change_pct+2
+            if new_stop > trade.dynamic_stop:
+                trade.dynamic_stop = new_stop
+
+        # ✅ Exit rules
+        if change_pct >= 13 or change_pct <= trade.dynamic_stop:
+            self.close_trade(identifier, ltp)
 
     # -------------------------------
     # CLOSE TRADE
@@ -146,22 +219,26 @@ class OrderManager:
                 return None
 
             trade = self.open_trades[identifier]
-            trade["Exit Time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            trade["Exit Price"] = float(exit_price)
+            trade.exit_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            trade.exit_price = float(exit_price)
 
-            if trade["Type"] == "CALL":
-                trade["P/L"] = (trade["Exit Price"] - trade["Entry Price"]) * trade["Qty"]
+            if trade.type == "CALL":
+                trade.pl = (trade.exit_price - trade.entry_price) * trade.qty
             else:  # PUT
-                trade["P/L"] = (trade["Entry Price"] - trade["Exit Price"]) * trade["Qty"]
+                trade.pl = (trade.entry_price - trade.exit_price) * trade.qty
 
-            if trade["Mode"] == "LIVE" and self.dhan:
+            if trade.mode == "LIVE" and self.dhan:
                 try:
-                    self.dhan.exit_order(trade["OrderID"])
+                    self.dhan.exit_order(trade.order_id)
                 except Exception as e:
                     print(f"[Close Trade] Error closing live order: {e}")
 
             self._append_to_log(trade)
             del self.open_trades[identifier]
+            if not self.open_trades:
+                self._wake.set()  # let the monitor thread notice the empty book and exit
+                if self.dhan:
+                    self.dhan.stop_feed()
 
         return trade
 
@@ -169,8 +246,22 @@ class OrderManager:
     # LOGGING
     # -------------------------------
     def _append_to_log(self, trade):
-        df = pd.DataFrame([trade])
-        if not os.path.exists(TRADE_LOG_PATH):
-            df.to_csv(TRADE_LOG_PATH, index=False)
-        else:
-            df.to_csv(TRADE_LOG_PATH, mode="a", index=False, header=False)
\ No newline at end of file
+        """Append one closed trade to the CSV log through a persistent writer (caller holds _lock)."""
+        if self._log_writer is None:
+            write_header = not os.path.exists(TRADE_LOG_PATH) or os.path.getsize(TRADE_LOG_PATH) == 0
+            self._log_file = open(TRADE_LOG_PATH, "a", newline="")
+            self._log_writer = csv.DictWriter(self._log_file, fieldnames=TRADE_LOG_FIELDS)
+            if write_header:
+                self._log_writer.writeheader()
+
+        self._log_writer.writerow(trade.to_log_row())
+        self._log_file.flush()
+
+    def close(self):
+        """Close the trade log handle; a later closed trade reopens it."""
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.flush()
+                self._log_file.close()
+            self._log_file = None
+            self._log_writer = None
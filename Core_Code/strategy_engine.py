@@ -1,18 +1,24 @@
 # code/strategy_engine.py
 import os
+import csv
 import time
 import threading
-import pickle
+import random
+import queue
 import numpy as np
 import pandas as pd
-from datetime import datetime
+from dataclasses import dataclass, field
+from datetime import datetime, time as dtime
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FetchTimeout
 import plotly.io as pio
 import plotly.graph_objects as go
-import requests
 import logging
-from Core_Code.nse_data_fetch import get_nifty_hist_data, get_option_data_from_nse, get_nifty_live_nse   
-from Core_Code.dhan_service import DhanService
-from Core_Code.dhan_service import DhanService
+from collections import deque
+from Core_Code.cache_utils import ttl_cache
+from Core_Code._indicators_njit import HAVE_NUMBA, sma_stream, welford_update, welford_slide, sample_std, decide
+from Core_Code.nse_data_fetch import get_nifty_hist_data, get_option_data_from_nse, get_nifty_live_nse
+from Core_Code.dhan_service import DhanService, DhanWebsocketFeed
 from Core_Code.order_manager import OrderManager
 
 # -----------------------------
@@ -29,11 +35,13 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 logger = logging.getLogger("StrategyEngine")
+if not HAVE_NUMBA:
+    logger.warning("numba not installed; indicator kernels run without JIT")
 
 # Paths inside assets
-NIFTY_PICKLE = os.path.join(ASSETS_DIR, "nifty_data.pickle")
-TEMP_OI_PICKLE = os.path.join(ASSETS_DIR, "temp_OI_data.pickle")
-OI_RUNNING_PICKLE = os.path.join(ASSETS_DIR, "OI_RUNNING_data.pickle")
+NIFTY_TICKS_CSV = os.path.join(ASSETS_DIR, "nifty_data.csv")
+TEMP_OI_FEATHER = os.path.join(ASSETS_DIR, "temp_OI_data.feather")
+OI_RUNNING_CSV = os.path.join(ASSETS_DIR, "OI_RUNNING_data.csv")
 OI_DATA_PLOT = os.path.join(ASSETS_DIR, "OI_DATA_Plot.jpg")
 VWAP_PLOT = os.path.join(ASSETS_DIR, "VWAP_Plot.jpg")
 NIFTY_CHART_PLOT = os.path.join(ASSETS_DIR, "Nifty_chart_plot.jpg")
@@ -41,29 +49,175 @@ DONE_SIGNAL = os.path.join(ASSETS_DIR, "done_signal.txt")
 PARAMS_FILE = os.path.join(ASSETS_DIR, "params_table.csv")
 CREDENTIALS_FILE = os.path.join(ASSETS_DIR, "credentials.txt")
 
-# -----------------------------
-# Globals
-# -----------------------------
-_runner_thread = None
-_runner_stop_event = None
-_dhan_service = None
-_order_manager = None
-_last_tick_time = None
-_live_mode = False
-# Load params table if exists
-if os.path.exists(PARAMS_FILE):
+# Session windows checked every tick
+_MKT_OPEN = dtime(9, 26)
+_MKT_CLOSE = dtime(15, 25)
+_ORDER_OPEN = dtime(11, 26)
+_ORDER_CLOSE = dtime(14, 25)
+_SQUARE_OFF = dtime(15, 0)
+
+FEED_MAX_AGE = 60  # seconds before a pushed quote is considered stale and REST is used instead
+LIVE_FETCH_TIMEOUT = 15     # seconds to wait on the Dhan/NSE live-quote race
+OPTION_FETCH_TIMEOUT = 30   # seconds to wait on the Dhan/NSE option-chain race
+RUNNER_JOIN_TIMEOUT = 60    # seconds start_runner waits for a stopped run to wind down
+
+DECISIONS = ("NEUTRAL", "CALL", "PUT")   # indexed by the decide() kernel's result
+
+# Every possible Prams key ("YESNONOYESNO", ...), indexed by its 5-bit YES/NO mask
+_PRAMS_KEYS = ["".join("YES" if idx >> bit & 1 else "NO" for bit in range(4, -1, -1)) for idx in range(32)]
+
+
+def _day_today_result(table, key):
+    if key not in table.index:
+        return "Bullish 50.0"
+    row = table.loc[key]
     try:
-        params_table_nifty = pd.read_csv(PARAMS_FILE, index_col="Prams")
+        bear = float(row["Bear%ge"])
+        bull = float(row["Bull%ge"])
     except Exception:
-        params_table_nifty = pd.DataFrame(columns=["Bear%ge", "Bull%ge"])
-else:
-    params_table_nifty = pd.DataFrame(columns=["Bear%ge", "Bull%ge"])
+        return "Bullish 50.0"
+    return f"Bearish {bear:.2f}" if bear > 50 else f"Bullish {bull:.2f}"
+
+
+# -----------------------------
+# Shared runner state
+# -----------------------------
+@dataclass
+class StrategyContext:
+    """Services and runner state shared by the UI thread and the runner thread; take `lock` to change them."""
+    dhan: Optional[DhanService] = None
+    feed: Optional[DhanWebsocketFeed] = None
+    order_mgr: Optional[OrderManager] = None
+    runner_thread: Optional[threading.Thread] = None
+    stop_event: Optional[threading.Event] = None
+    last_tick: Optional[str] = None     # "HH:MM:SS" of the last processed tick
+    status_version: int = 0             # bumped on every tick/start/stop; watched by wait_for_status
+    live_mode: bool = False
+    params_table: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=["Bear%ge", "Bull%ge"]))
+    day_today_lut: list = field(default_factory=lambda: ["Bullish 50.0"] * 32)   # day_today result per Prams mask
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+    status_changed: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+
+CTX = StrategyContext()
+
+
+def load_params_table():
+    """(Re)load params_table.csv and rebuild the 32-entry day_today lookup table."""
+    table = pd.DataFrame(columns=["Bear%ge", "Bull%ge"])
+    if os.path.exists(PARAMS_FILE):
+        try:
+            table = pd.read_csv(PARAMS_FILE, index_col="Prams")
+        except Exception:
+            pass
+    lut = [_day_today_result(table, key) for key in _PRAMS_KEYS]
+    with CTX.lock:
+        CTX.params_table, CTX.day_today_lut = table, lut
+
+
+load_params_table()
+
+
+# -----------------------------
+# Ring buffers
+# -----------------------------
+RING_CAP = 128  # rows kept for indicators, charts and the dashboard tail
+
+NIFTY_COLUMNS = {
+    "Open": np.float64, "High": np.float64, "Low": np.float64, "Close": np.float64, "Volume": np.float64,
+    "EOD_TIMESTAMP": object, "load_time": object,
+    "Vwap": np.float64, "Rolling_Vwap": np.float64, "Upper_Bound": np.float64, "Lower_Bound": np.float64,
+    "7MVA": np.float64, "Stoc_Signal": np.float64, "RSI": np.float64,
+}
+OI_RUNNING_COLUMNS = {
+    "PUT_OI_DIFF_CUM": np.float64, "Call_OI_DIFF_CUM": np.float64, "Data_diff": np.float64, "PCR": np.float64,
+    "CALL_ODIN_MAX": object, "PUT_ODIN_MAX": object,
+    "CALL_ODIN_STRIKE": np.float64, "CALL_ODIN_VALUE": np.float64, "PUT_ODIN_STRIKE": np.float64, "PUT_ODIN_VALUE": np.float64,
+    "Time_stamp": object, "underlying": np.float64,
+    "Vwap": np.float64, "Decision": object, "day_today": object, "trend_data": object,
+}
+
+
+class RingFrame:
+    """Fixed-capacity column store (one preallocated NumPy array per column) with wrap-around writes."""
+
+    def __init__(self, columns: dict, cap: int = RING_CAP):
+        self.cap = cap
+        self.cols = {name: np.empty(cap, dtype=dtype) for name, dtype in columns.items()}
+        self.pos = 0      # next write slot
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, row: dict):
+        for name, arr in self.cols.items():
+            arr[self.pos] = row.get(name, np.nan if arr.dtype.kind == "f" else "")
+        self.pos = (self.pos + 1) % self.cap
+        self.count = min(self.count + 1, self.cap)
+
+    def extend(self, df: pd.DataFrame):
+        for row in df.tail(self.cap).to_dict("records"):
+            self.append(row)
+
+    def last(self, name):
+        return self.cols[name][self.pos - 1]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Materialize the buffered rows, oldest first."""
+        if self.count < self.cap:
+            data = {name: arr[:self.count] for name, arr in self.cols.items()}
+        else:
+            data = {name: np.concatenate((arr[self.pos:], arr[:self.pos])) for name, arr in self.cols.items()}
+        return pd.DataFrame(data)
+
+
+class TickLog:
+    """Append-only CSV for one trading day: header when started, then one flushed row per tick."""
+
+    def __init__(self, path, columns):
+        self.columns = list(columns)
+        # A runner restart the same day keeps appending; a log last written on an earlier day starts over
+        self.is_new = (
+            not os.path.exists(path)
+            or os.path.getsize(path) == 0
+            or datetime.fromtimestamp(os.path.getmtime(path)).date() != datetime.now().date()
+        )
+        self._file = open(path, "w" if self.is_new else "a", newline="")
+        self._writer = csv.writer(self._file)
+        if self.is_new:
+            self._writer.writerow(self.columns)
+            self._file.flush()
+
+    def append(self, row: dict):
+        self._writer.writerow([row.get(col, "") for col in self.columns])
+        self._file.flush()
+
+    def extend(self, df: pd.DataFrame):
+        for row in df.to_dict("records"):
+            self._writer.writerow([row.get(col, "") for col in self.columns])
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
 
 
 # -----------------------------
 # StrategyEngine
 # -----------------------------
 class StrategyEngine:
+    VWAP_N, RVWAP_N, MVA7_N, RSI_N = 10, 20, 7, 14
+
+    def __init__(self):
+        self._closes = deque(maxlen=self.RVWAP_N)   # last 20 closes cover the 10/20/7 windows
+        self._deltas = deque(maxlen=self.RSI_N)
+        self._vwap_sum = 0.0
+        self._mva7_sum = 0.0
+        self._rvwap_mean = 0.0                      # Welford state for Rolling_Vwap / std20
+        self._rvwap_m2 = 0.0
+        self._rsi_up = 0.0
+        self._rsi_dn = 0.0
+
     def add_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         df = df.copy().reset_index(drop=True)
         if "Close" not in df.columns and "close" in df.columns:
@@ -88,6 +242,60 @@ class StrategyEngine:
         df["RSI"] = 100 - (100 / (1 + rs))
         return df
 
+    def seed_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Full add_indicators pass once at startup; primes the streaming state for update_indicators."""
+        df = self.add_indicators(df)
+        self.__init__()
+        closes = df["Close"].astype(float).tolist()
+        prev = closes[0] if closes else None
+        for close in closes:
+            self._push(close, close - prev)
+            prev = close
+        return df
+
+    def update_indicators(self, close) -> dict:
+        """Append one close and return its indicator values, same as the last row of add_indicators."""
+        close = float(close)
+        delta = close - self._closes[-1] if self._closes else 0.0
+        self._push(close, delta)
+
+        n20 = len(self._closes)
+        n10 = min(n20, self.VWAP_N)
+        n7 = min(n20, self.MVA7_N)
+        vwap = self._vwap_sum / n10
+        std20 = sample_std(self._rvwap_m2, n20)
+        rd = self._rsi_dn / len(self._deltas)
+        rs = (self._rsi_up / len(self._deltas)) / (rd if rd > 0 else 1e-6)
+        return {
+            "Vwap": vwap,
+            "Rolling_Vwap": self._rvwap_mean,
+            "Upper_Bound": vwap + 2 * std20,
+            "Lower_Bound": vwap - 2 * std20,
+            "7MVA": self._mva7_sum / n7,
+            "Stoc_Signal": int(np.sign(delta)),
+            "RSI": 100 - (100 / (1 + rs)),
+        }
+
+    def _push(self, close, delta):
+        """Advance every running window by one close (and its diff from the previous close)."""
+        closes = self._closes
+
+        def dropped(n):
+            return closes[-n] if len(closes) >= n else 0.0
+
+        self._vwap_sum, _ = sma_stream(self._vwap_sum, close, dropped(self.VWAP_N), self.VWAP_N)
+        self._mva7_sum, _ = sma_stream(self._mva7_sum, close, dropped(self.MVA7_N), self.MVA7_N)
+        if len(closes) == self.RVWAP_N:
+            self._rvwap_mean, self._rvwap_m2 = welford_slide(self._rvwap_mean, self._rvwap_m2, self.RVWAP_N, close, closes[0])
+        else:
+            self._rvwap_mean, self._rvwap_m2 = welford_update(self._rvwap_mean, self._rvwap_m2, len(closes) + 1, close)
+        closes.append(close)
+
+        old = self._deltas[0] if len(self._deltas) == self.RSI_N else 0.0
+        self._rsi_up, _ = sma_stream(self._rsi_up, max(delta, 0.0), max(old, 0.0), self.RSI_N)
+        self._rsi_dn, _ = sma_stream(self._rsi_dn, max(-delta, 0.0), max(-old, 0.0), self.RSI_N)
+        self._deltas.append(delta)
+
     def day_today_params(self, hist_df: pd.DataFrame, live_snapshot: dict):
         if hist_df is None or hist_df.empty:
             return "Bullish 50.0"
@@ -96,139 +304,211 @@ class StrategyEngine:
         except Exception:
             return "Bullish 50.0"
 
-        dp = hist_df.tail(1).copy().reset_index(drop=True)
-        for col in ["Vwap", "Rolling_Vwap", "Upper_Bound", "Lower_Bound", "7MVA"]:
-            if col not in dp.columns:
-                dp = self.add_indicators(hist_df).tail(1).reset_index(drop=True)
-
-        dp["Open2prevVwap"] = np.where(today_open > dp["Vwap"], "YES", "NO")
-        dp["Open2prevRVwap"] = np.where(today_open > dp["Rolling_Vwap"], "YES", "NO")
-        dp["open2uprbond"] = np.where(today_open > dp["Upper_Bound"], "YES", "NO")
-        dp["open2lwrbond"] = np.where(today_open < dp["Lower_Bound"], "YES", "NO")
-        dp["7-14MVA"] = np.where(today_open > dp["7MVA"], "YES", "NO")
-
-        dp["Prams"] = dp.apply(
-            lambda x: x["Open2prevVwap"]
-            + x["Open2prevRVwap"]
-            + x["open2uprbond"]
-            + x["open2lwrbond"]
-            + x["7-14MVA"],
-            axis=1,
+        cols = ["Vwap", "Rolling_Vwap", "Upper_Bound", "Lower_Bound", "7MVA"]
+        dp = hist_df if all(col in hist_df.columns for col in cols) else self.add_indicators(hist_df)
+        vwap, rvwap, upper, lower, mva7 = dp[cols].to_numpy(dtype=np.float64)[-1]
+
+        # Open2prevVwap | Open2prevRVwap | open2uprbond | open2lwrbond | 7-14MVA, first flag in the high bit
+        idx = (
+            (today_open > vwap) << 4
+            | (today_open > rvwap) << 3
+            | (today_open > upper) << 2
+            | (today_open < lower) << 1
+            | (today_open > mva7)
         )
-        pr = dp["Prams"].iloc[0]
-
-        if pr in params_table_nifty.index:
-            row = params_table_nifty.loc[pr]
-            try:
-                bear = float(row["Bear%ge"])
-                bull = float(row["Bull%ge"])
-            except Exception:
-                return "Bullish 50.0"
-            return f"Bearish {bear:.2f}" if bear > 50 else f"Bullish {bull:.2f}"
-        return "Bullish 50.0"
+        return CTX.day_today_lut[idx]
 
     def calculate_trend(self, arr):
-        if len(arr) < 2:
+        a = np.asarray(arr, dtype=np.float64)
+        n = a.size
+        if n < 2:
             return "insufficient data"
-        z = np.polyfit(range(len(arr)), arr, 1)
-        return "up" if z[0] > 0 else "down"
+        # Sign of the least-squares slope: only the numerator sum((x - x̄)(y - ȳ)) matters
+        x = np.arange(n) - (n - 1) / 2
+        return "up" if (x * (a - a.mean())).sum() > 0 else "down"
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
 def init_services(client_id=None, access_token=None, access_key=None):
-    global _dhan_service, _order_manager
-    if client_id and access_token:
-        try:
-            _dhan_service = DhanService(client_id, access_token)
-        except Exception as e:
-            logger.error(f"DhanService init failed: {e}")
-            _dhan_service = None
-    else:
-        _dhan_service = None
-    _order_manager = OrderManager(_dhan_service)
+    with CTX.lock:
+        if CTX.feed is not None:
+            CTX.feed.stop()
+        if CTX.dhan is not None:
+            CTX.dhan.stop_feed()
+        CTX.dhan = CTX.feed = None
+        if client_id and access_token:
+            try:
+                CTX.dhan = DhanService(client_id, access_token)
+            except Exception as e:
+                logger.error(f"DhanService init failed: {e}")
+            if CTX.dhan is not None:
+                CTX.feed = DhanWebsocketFeed(client_id, access_token).start()
+        CTX.order_mgr = OrderManager(CTX.dhan)
 
 
 def get_nifty_live():
     """
     Get live Nifty data.
-    Priority: Dhan API -> NSE API (get_nifty_live_nse).
-    Returns a pd.Series with keys: OPEN, HIGH, LOW, LTP, Volume, Date, load_time
+    Priority: Dhan websocket feed, then Dhan API and NSE API (get_nifty_live_nse) fetched concurrently, Dhan preferred.
+    Returns a plain dict with keys: OPEN, HIGH, LOW, LTP, Volume, Date, load_time ({} if every source fails)
     """
+    now = datetime.now()
 
-    # ---- Try Dhan API first ----
-    if _dhan_service is not None:
+    # ---- Latest pushed quote from the Dhan feed, if fresh ----
+    feed, dhan = CTX.feed, CTX.dhan
+    quote = feed.quote(max_age=FEED_MAX_AGE) if feed is not None else None
+    if quote:
         try:
-            quote = _dhan_service.get_quote("NSE:NIFTY50")
-            if quote:
-                row = {
-                    "OPEN": float(quote.get("open", 0)),
-                    "HIGH": float(quote.get("high", 0)),
-                    "LOW": float(quote.get("low", 0)),
-                    "LTP": float(quote.get("lastPrice", quote.get("ltp", 0))),
-                    "Volume": float(quote.get("volume", 0)),
-                    "Date": datetime.now().strftime("%d-%m-%Y"),
-                    "load_time": datetime.now().strftime("%H:%M:%S"),
-                }
-                return pd.Series(row)
+            row = {
+                "OPEN": float(quote.get("open", 0)),
+                "HIGH": float(quote.get("high", 0)),
+                "LOW": float(quote.get("low", 0)),
+                "LTP": float(quote.get("LTP", 0)),
+                "Volume": float(quote.get("volume", 0)),
+                "Date": now.strftime("%d-%m-%Y"),
+                "load_time": now.strftime("%H:%M:%S"),
+            }
+            return row
         except Exception as e:
-            print(f"[get_nifty_live] Dhan API failed, trying NSE fallback: {e}")
+            print(f"[get_nifty_live] Bad feed packet, falling back to REST: {e}")
 
-    # ---- Fallback: NSE live API ----
+    # ---- Dhan REST and the NSE live API fetched together; Dhan wins whenever it answers in time ----
+    sources = [("nifty_nse", lambda: _nifty_live_nse(now))]
+    if dhan is not None:
+        sources.insert(0, ("nifty_dhan", lambda: _nifty_live_dhan(dhan, now)))
+    _, row = _first_non_empty(sources, LIVE_FETCH_TIMEOUT)
+    return row or {}
+
+
+def _nifty_live_dhan(dhan, now):
     try:
-        nse_row = get_nifty_live_nse()
-        if not nse_row.empty:
-            row = {
+        quote = dhan.get_index_quote()
+        if quote:
+            return {
+                "OPEN": float(quote.get("open", 0)),
+                "HIGH": float(quote.get("high", 0)),
+                "LOW": float(quote.get("low", 0)),
+                "LTP": float(quote.get("ltp", 0)),
+                "Volume": float(quote.get("volume", 0)),
+                "Date": now.strftime("%d-%m-%Y"),
+                "load_time": now.strftime("%H:%M:%S"),
+            }
+    except Exception as e:
+        print(f"[get_nifty_live] Dhan API failed: {e}")
+    return {}
+
+
+def _nifty_live_nse(now):
+    try:
+        nse_df = get_nifty_live_nse()
+        if not nse_df.empty:
+            nse_row = nse_df.iloc[0]
+            return {
                 "OPEN": float(nse_row.get("OPEN", 0)),
                 "HIGH": float(nse_row.get("HIGH", 0)),
                 "LOW": float(nse_row.get("LOW", 0)),
                 "LTP": float(nse_row.get("LTP", 0)),
                 "Volume": float(nse_row.get("Volume", 0)),
-                "Date": nse_row.get("Date", datetime.now().strftime("%d-%m-%Y")),
-                "load_time": nse_row.get("load_time", datetime.now().strftime("%H:%M:%S")),
+                "Date": nse_row.get("Date", now.strftime("%d-%m-%Y")),
+                "load_time": nse_row.get("load_time", now.strftime("%H:%M:%S")),
             }
-            return pd.Series(row)
     except Exception as e:
-        print(f"[get_nifty_live] NSE fetch also failed: {e}")
+        print(f"[get_nifty_live] NSE fetch failed: {e}")
+    return {}
+
+
+# -----------------------------
+# Concurrent source fetch
+# -----------------------------
+_fetch_pool = ThreadPoolExecutor(max_workers=4)
+_inflight = {}   # {source name: Future} so a fetch still running from an earlier call is joined, not duplicated
+_inflight_lock = threading.Lock()
+
 
-    # ---- If both fail ----
-    return pd.Series()
+def _submit_once(name, fn):
+    with _inflight_lock:
+        future = _inflight.get(name)
+        if future is None or future.done():
+            future = _inflight[name] = _fetch_pool.submit(fn)
+    return future
+
+
+def _first_non_empty(sources, timeout):
+    """
+    Run [(name, fetch_fn), ...] concurrently and return (name, result) for the first source, in list order, with a non-empty result.
+    A later source only wins once every source ahead of it has failed or come back empty, or `timeout` seconds pass.
+    Returns (None, None) if all fail, come back empty, or nothing answered within `timeout`.
+    """
+    futures = [(name, _submit_once(name, fn)) for name, fn in sources]
+    results = {}   # {name: non-empty result, or None for a failed/empty source}
+
+    def _preferred(finished_only):
+        for name, _ in futures:
+            if name not in results:
+                if finished_only:
+                    return None, None   # a preferred source is still running; wait for it
+                continue
+            if results[name] is not None:
+                return name, results[name]
+        return None, None
+
+    try:
+        for future in as_completed([f for _, f in futures], timeout=timeout):
+            name = next(n for n, f in futures if f is future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"[Data Fetch ERROR] {name} failed: {e}")
+                result = None
+            results[name] = result if result is not None and len(result) else None
+            name, result = _preferred(finished_only=True)
+            if name is not None:
+                return name, result
+    except FetchTimeout:
+        name, result = _preferred(finished_only=False)
+        if name is not None:
+            logger.warning(f"[Data Fetch] Preferred source timed out after {timeout}s; using {name}")
+            return name, result
+        logger.warning(f"[Data Fetch] No source answered within {timeout}s")
+    return None, None
 
 
 def adding_indicators(df):
     return StrategyEngine().add_indicators(df)
 
 
-def get_option_data():
-    global _dhan_service
+@ttl_cache(seconds=30)
+def get_option_data(stop_event=None):
+    dhan = CTX.dhan
     MAX_RETRIES = 2      # Total attempts = 1 (initial) + 2 (retries) = 3
-    RETRY_DELAY = 120    # 2 minutes in seconds
+    MAX_RETRY_DELAY = 60
 
     for attempt in range(MAX_RETRIES + 1):
-        try:
-            # 1. Try Dhan API (if initialized)
-            if _dhan_service:
-                df = _dhan_service.get_option_chain()
-                if not df.empty:
-                    logger.info(f"[Data Fetch] Success via Dhan API on attempt {attempt + 1}.")
-                    return df
-
-            # 2. Fallback to NSE scrape
-            # NOTE: Assuming this is the scraping function defined/imported elsewhere
-            df = get_option_data_from_nse() 
-            if not df.empty:
-                logger.info(f"[Data Fetch] Success via NSE Scrape on attempt {attempt + 1}.")
-                return df
-
-        except Exception as e:
-            # Log the error but continue to the retry check
-            logger.error(f"[Data Fetch ERROR] Attempt {attempt + 1} failed: {e}")
-        
-        # If both attempts failed or an exception occurred, check for retry
+        # Fetch the Dhan API and the NSE scrape together; Dhan's chain wins whenever it answers in time
+        sources = [("oc_nse", get_option_data_from_nse)]
+        if dhan:
+            sources.insert(0, ("oc_dhan", dhan.get_option_chain))
+        source, df = _first_non_empty(sources, OPTION_FETCH_TIMEOUT)
+        if df is not None:
+            logger.info(f"[Data Fetch] Success via {source} on attempt {attempt + 1}.")
+            df.attrs["source"] = source   # identifier_CE/PE are Dhan security ids only for an oc_dhan chain
+            return df
+
+        # If every source failed, timed out or came back empty, retry with jittered exponential backoff (~2s, ~4s)
         if attempt < MAX_RETRIES:
-            logger.warning(f"[Data Fetch] Retrying in {RETRY_DELAY} seconds...")
-            time.sleep(RETRY_DELAY)
+            delay = min(MAX_RETRY_DELAY, 2 ** (attempt + 1)) + random.random()
+            logger.warning(f"[Data Fetch] Retrying in {delay:.1f} seconds...")
+            # Drop the sources' short-lived cached failures so the retry really refetches
+            get_option_data_from_nse.invalidate()
+            if dhan:
+                dhan.get_option_chain.invalidate()
+            if stop_event is not None:
+                if stop_event.wait(delay):
+                    return pd.DataFrame()
+            else:
+                time.sleep(delay)
         
     # If all attempts fail, return an empty DataFrame and log the final failure
     logger.error("[Data Fetch] All attempts failed after retries. Returning empty data.")
@@ -252,21 +532,98 @@ def get_OIDATA_Graph(oi_df, nifty_df):
     return fig1, fig2
 
 
-def enter_order(identifier, price, strike_type, strike_price, live_mode=False):
-    if not _order_manager:
+def enter_order(identifier, price, strike_type, strike_price, live_mode=False, order_mgr=None):
+    order_mgr = order_mgr or CTX.order_mgr   # run_loop passes its own manager so the square-off sees the trade
+    if not order_mgr:
         return None
     if live_mode: 
-        return _order_manager.live_trade(identifier, 2, strike_type, strike_price, price) #Change LOT Size later
+        return order_mgr.live_trade(identifier, 2, strike_type, strike_price, price) #Change LOT Size later
+    else:
+        return order_mgr.paper_trade(identifier, 2, strike_type, strike_price, price) #Change LOT Size later based on Risk Amount
+
+# -----------------------------
+# Artifact writer
+# -----------------------------
+_io_queue = queue.Queue(maxsize=2)   # one job = every artifact for a tick, written in order
+_io_thread = None
+_io_lock = threading.Lock()
+
+
+def _artifact_worker():
+    while True:
+        jobs = _io_queue.get()
+        for kind, payload, path in jobs:
+            try:
+                if kind == "feather":
+                    # Write beside the target and swap in, so a reader memory-mapping the old file never sees a truncated one
+                    tmp_path = path + ".tmp"
+                    payload.reset_index().to_feather(tmp_path)
+                    os.replace(tmp_path, path)
+                elif kind == "images":
+                    _write_images(payload, path)
+                else:
+                    with open(path, "w") as f:
+                        f.write(payload)
+            except Exception as e:
+                names = [path] if isinstance(path, str) else path
+                logger.error(f"Artifact write failed for {', '.join(map(os.path.basename, names))}: {e}")
+        _io_queue.task_done()
+
+
+def _write_images(figs, paths):
+    """Render several figures in one Kaleido session when plotly supports it (plotly>=6.1)."""
+    if hasattr(pio, "write_images"):
+        pio.write_images(figs, paths)
     else:
-        return _order_manager.paper_trade(identifier, 2, strike_type, strike_price, price) #Change LOT Size later based on Risk Amount
+        for fig, path in zip(figs, paths):
+            pio.write_image(fig, path)
+
+
+def save_artifacts(jobs):
+    """Hand a tick's snapshot/plots/done-signal to the writer thread; drops the oldest pending tick if backlogged."""
+    global _io_thread
+    with _io_lock:
+        if _io_thread is None:
+            _io_thread = threading.Thread(target=_artifact_worker, daemon=True)
+            _io_thread.start()
+
+    try:
+        _io_queue.put_nowait(jobs)
+    except queue.Full:
+        # Same paths are overwritten every tick, so a stale pending tick is safe to drop
+        try:
+            _io_queue.get_nowait()
+            _io_queue.task_done()
+        except queue.Empty:
+            pass
+        _io_queue.put_nowait(jobs)
+
 
 # -----------------------------
 # Runner Loop
 # -----------------------------
 def run_loop(client_id=None, access_token=None, access_key=None, stop_event=None, live_mode=False):
-    global _last_tick_time, _live_mode
-    _live_mode = live_mode
+    ctx = CTX
     init_services(client_id, access_token, access_key)
+    with ctx.lock:
+        ctx.live_mode = live_mode
+        order_mgr, dhan, feed = ctx.order_mgr, ctx.dhan, ctx.feed
+    try:
+        _run_ticks(ctx, order_mgr, stop_event)
+    finally:
+        # Websocket threads reconnect forever unless stopped; don't leave them running after the runner exits
+        if feed is not None:
+            feed.stop()
+        if dhan is not None:
+            dhan.stop_feed()
+        with ctx.lock:
+            if ctx.feed is feed:
+                ctx.feed = None
+        if order_mgr:
+            order_mgr.close()
+
+
+def _run_ticks(ctx, order_mgr, stop_event):
     engine = StrategyEngine()
 
     try:
@@ -275,36 +632,60 @@ def run_loop(client_id=None, access_token=None, access_key=None, stop_event=None
         nifty_hist_data = pd.DataFrame()
 
     columns = ["Open", "High", "Low", "Close", "Volume", "EOD_TIMESTAMP"]
-    nifty_today = nifty_hist_data.loc[:, columns].tail(18).copy() if not nifty_hist_data.empty else pd.DataFrame(columns=columns)
-    nifty_today["load_time"] = ""
-    oi_running = pd.DataFrame()
+    seed = nifty_hist_data.loc[:, columns].tail(18).copy() if not nifty_hist_data.empty else pd.DataFrame(columns=columns)
+    seed["load_time"] = ""
+    nifty_today = RingFrame(NIFTY_COLUMNS)
+    nifty_today.extend(engine.seed_indicators(seed))
+    oi_running = RingFrame(OI_RUNNING_COLUMNS)
+    nifty_log = TickLog(NIFTY_TICKS_CSV, NIFTY_COLUMNS)
+    if nifty_log.is_new:
+        nifty_log.extend(nifty_today.to_frame())   # history seed rows, once per day
+    oi_log = TickLog(OI_RUNNING_CSV, OI_RUNNING_COLUMNS)
     window_size = 5
-
-    while not (stop_event and stop_event.is_set()):
-        now = datetime.now().time()
-        if now >= datetime.strptime("09:26", "%H:%M").time() and now <= datetime.strptime("15:25", "%H:%M").time():
+    data_diffs = deque(maxlen=window_size)
+
+    # Figures are built once and only have their trace data swapped each tick
+    nifty_frame = nifty_today.to_frame()
+    fig_nifty = nifty_Chart(nifty_frame)
+    fig_oi, fig_vwap = get_OIDATA_Graph(oi_running.to_frame(), nifty_frame)
+
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        loop_now = datetime.now()   # one clock read per tick for every window check below
+        loop_t = loop_now.time()
+        if _MKT_OPEN <= loop_t <= _MKT_CLOSE:
             try:
                 df_temp = get_nifty_live()
-                _last_tick_time = datetime.now().strftime("%H:%M:%S")
-                temp_df = pd.DataFrame(
-                    [
-                        {
-                            "Open": df_temp["OPEN"],
-                            "High": df_temp["HIGH"],
-                            "Low": df_temp["LOW"],
-                            "Close": df_temp["LTP"],
-                            "Volume": df_temp["Volume"],
-                            "EOD_TIMESTAMP": df_temp["Date"],
-                            "load_time": df_temp["load_time"],
-                        }
-                    ]
-                )
-                nifty_today = pd.concat([nifty_today, temp_df], ignore_index=True)
-                nifty_today = adding_indicators(nifty_today)
-
-                temp_oi = get_option_data()
-                put_sum = float(temp_oi["PUT_OI_DIFF"].sum())
-                call_sum = float(temp_oi["Call_OI_Diff"].sum())
+                ctx.last_tick = loop_now.strftime("%H:%M:%S")
+                _notify_status()
+                tick = {
+                    "Open": df_temp["OPEN"],
+                    "High": df_temp["HIGH"],
+                    "Low": df_temp["LOW"],
+                    "Close": df_temp["LTP"],
+                    "Volume": df_temp["Volume"],
+                    "EOD_TIMESTAMP": df_temp["Date"],
+                    "load_time": df_temp["load_time"],
+                    **engine.update_indicators(df_temp["LTP"]),
+                }
+                nifty_today.append(tick)
+                nifty_log.append(tick)
+
+                temp_oi = get_option_data(stop_event)
+                # Hot columns as NumPy once per tick; everything below indexes them positionally
+                _oi = {
+                    "put_diff": temp_oi["PUT_OI_DIFF"].to_numpy(),
+                    "call_diff": temp_oi["Call_OI_Diff"].to_numpy(),
+                    "call_odin": temp_oi["Call_ODIN"].to_numpy(),
+                    "put_odin": temp_oi["PUT_ODIN"].to_numpy(),
+                    "strikes": temp_oi.index.to_numpy(),
+                    "ce_ident": temp_oi["identifier_CE"].to_numpy(),
+                    "pe_ident": temp_oi["identifier_PE"].to_numpy(),
+                    "ce_bid": temp_oi["CALL_value_Bid"].to_numpy(),
+                    "pe_bid": temp_oi["put_value_Bid"].to_numpy(),
+                }
+                put_sum = float(_oi["put_diff"].sum())
+                call_sum = float(_oi["call_diff"].sum())
                 new_row = {
                     "PUT_OI_DIFF_CUM": put_sum,
                     "Call_OI_DIFF_CUM": call_sum,
@@ -312,134 +693,135 @@ def run_loop(client_id=None, access_token=None, access_key=None, stop_event=None
                     "PCR": put_sum / call_sum if call_sum else float("inf"),
                 }
 
-                try:
-                    cs = int(temp_oi["Call_ODIN"].idxmax())
-                    new_row["CALL_ODIN_MAX"] = f"{cs} {temp_oi.loc[cs, 'Call_ODIN']}"
-                except Exception:
-                    new_row["CALL_ODIN_MAX"] = "0 0"
-                try:
-                    ps = int(temp_oi["PUT_ODIN"].idxmax())
-                    new_row["PUT_ODIN_MAX"] = f"{ps} {temp_oi.loc[ps, 'PUT_ODIN']}"
-                except Exception:
-                    new_row["PUT_ODIN_MAX"] = "0 0"
+                # Max-OI legs kept numeric for the decision; the "strike value" strings are for the logs only
+                call_pos = put_pos = None
+                new_row["CALL_ODIN_STRIKE"] = new_row["CALL_ODIN_VALUE"] = 0.0
+                new_row["PUT_ODIN_STRIKE"] = new_row["PUT_ODIN_VALUE"] = 0.0
+                if len(_oi["strikes"]):
+                    call_pos = int(np.argmax(_oi["call_odin"]))
+                    put_pos = int(np.argmax(_oi["put_odin"]))
+                    new_row["CALL_ODIN_STRIKE"] = int(_oi["strikes"][call_pos])
+                    new_row["CALL_ODIN_VALUE"] = float(_oi["call_odin"][call_pos])
+                    new_row["PUT_ODIN_STRIKE"] = int(_oi["strikes"][put_pos])
+                    new_row["PUT_ODIN_VALUE"] = float(_oi["put_odin"][put_pos])
+                new_row["CALL_ODIN_MAX"] = f"{new_row['CALL_ODIN_STRIKE']} {int(new_row['CALL_ODIN_VALUE'])}"
+                new_row["PUT_ODIN_MAX"] = f"{new_row['PUT_ODIN_STRIKE']} {int(new_row['PUT_ODIN_VALUE'])}"
 
                 new_row["Time_stamp"] = temp_oi["time_stamp"].iloc[0]
                 new_row["underlying"] = temp_oi["underlyingValue"].iloc[0]
-                new_row["Vwap"] = nifty_today.iloc[-1]["Vwap"]
+                new_row["Vwap"] = nifty_today.last("Vwap")
 
                 # Decision
-                call_parts = new_row["CALL_ODIN_MAX"].split()
-                put_parts = new_row["PUT_ODIN_MAX"].split()
-                try:
-                    if float(put_parts[1]) - float(call_parts[1]) > 0 and new_row["Data_diff"] > 0 and new_row["PCR"] > 1.25:
-                        new_row["Decision"] = "CALL"
-                    elif float(put_parts[1]) - float(call_parts[1]) < 0 and new_row["Data_diff"] < 0 and new_row["PCR"] < 0.75:
-                        new_row["Decision"] = "PUT"
-                    else:
-                        new_row["Decision"] = "NEUTRAL"
-                except Exception:
-                    new_row["Decision"] = "NEUTRAL"
+                new_row["Decision"] = DECISIONS[decide(
+                    new_row["PUT_ODIN_VALUE"], new_row["CALL_ODIN_VALUE"], new_row["Data_diff"], new_row["PCR"]
+                )]
 
                 # Day params + trend
-                new_row["day_today"] = engine.day_today_params(nifty_hist_data, {"OPEN": float(temp_df["Open"].iloc[-1])})
-                new_row["trend_data"] = ""
-                oi_running = pd.concat([oi_running, pd.DataFrame([new_row])], ignore_index=True)
-                temp1 = pd.to_numeric(oi_running["Data_diff"], errors="coerce")
-                if len(temp1) >= window_size:
-                    oi_running.at[oi_running.index[-1], "trend_data"] = engine.calculate_trend(temp1[-window_size:])
-
-                # Save artifacts
-                with open(NIFTY_PICKLE, "wb") as f:
-                    pickle.dump(nifty_today, f)
-                with open(TEMP_OI_PICKLE, "wb") as f:
-                    pickle.dump(temp_oi, f)
-                with open(OI_RUNNING_PICKLE, "wb") as f:
-                    pickle.dump(oi_running, f)
-
-                try:
-                    fig_nifty = nifty_Chart(nifty_today)
-                    fig_oi, fig_vwap = get_OIDATA_Graph(oi_running, nifty_today)
-                    pio.write_image(fig_oi, OI_DATA_PLOT)
-                    pio.write_image(fig_vwap, VWAP_PLOT)
-                    pio.write_image(fig_nifty, NIFTY_CHART_PLOT)
-                except Exception:
-                    pass
-
-                with open(DONE_SIGNAL, "w") as f:
-                    f.write("done")
+                new_row["day_today"] = engine.day_today_params(nifty_hist_data, {"OPEN": float(nifty_today.last("Open"))})
+                data_diffs.append(new_row["Data_diff"])
+                new_row["trend_data"] = engine.calculate_trend(list(data_diffs)) if len(data_diffs) == window_size else ""
+                oi_running.append(new_row)
+                oi_log.append(new_row)
+
+                # Save artifacts (option-chain snapshot + plots) on the writer thread
+                nifty_frame = nifty_today.to_frame()
+                oi_running_frame = oi_running.to_frame()
+                fig_nifty.data[0].update(x=nifty_frame["EOD_TIMESTAMP"], y=nifty_frame["Close"])
+                fig_oi.data[0].update(x=oi_running_frame.index, y=oi_running_frame["Data_diff"])
+                fig_vwap.data[0].update(x=nifty_frame.index, y=nifty_frame["Vwap"])
+                save_artifacts([
+                    ("feather", temp_oi, TEMP_OI_FEATHER),
+                    # Snapshot copies: the live figures are updated again next tick while the writer renders
+                    ("images", [go.Figure(fig) for fig in (fig_oi, fig_vwap, fig_nifty)],
+                     [OI_DATA_PLOT, VWAP_PLOT, NIFTY_CHART_PLOT]),
+                    ("text", "done", DONE_SIGNAL),
+                ])
 
                 # Order window
-                if datetime.now().time() >= datetime.strptime("11:26", "%H:%M").time() and datetime.now().time() <= datetime.strptime("14:25", "%H:%M").time():
-                    if _order_manager and not _order_manager.order_flag:
-                        last_idx = -1
+                if _ORDER_OPEN <= loop_t <= _ORDER_CLOSE:
+                    if order_mgr and not order_mgr.order_flag.is_set():
+                        stoc_signal = int(nifty_today.last("Stoc_Signal"))
                         cond_call = (
-                            oi_running["Decision"].iloc[last_idx] == "CALL"
-                            and oi_running["trend_data"].iloc[last_idx] == "up"
-                            and str(oi_running["day_today"].iloc[last_idx]).startswith("Bullish")
-                            and int(nifty_today["Stoc_Signal"].tail(1).iloc[0]) == 1
+                            new_row["Decision"] == "CALL"
+                            and new_row["trend_data"] == "up"
+                            and str(new_row["day_today"]).startswith("Bullish")
+                            and stoc_signal == 1
                         )
                         cond_put = (
-                            oi_running["Decision"].iloc[last_idx] == "PUT"
-                            and oi_running["trend_data"].iloc[last_idx] == "down"
-                            and str(oi_running["day_today"].iloc[last_idx]).startswith("Bearish")
-                            and int(nifty_today["Stoc_Signal"].tail(1).iloc[0]) == -1
+                            new_row["Decision"] == "PUT"
+                            and new_row["trend_data"] == "down"
+                            and str(new_row["day_today"]).startswith("Bearish")
+                            and stoc_signal == -1
                         )
                         option_type = "CALL" if cond_call else "PUT" if cond_put else None
+                        if option_type and ctx.live_mode and temp_oi.attrs.get("source") != "oc_dhan":
+                            logger.warning(f"Live {option_type} entry skipped: option chain came from "
+                                           f"{temp_oi.attrs.get('source')}, whose identifiers are not Dhan security ids")
+                            option_type = None
                         if option_type:
                             try:
+                                pos = call_pos if option_type == "CALL" else put_pos
+                                if pos is None:
+                                    raise ValueError(f"no max-OI {option_type} strike this tick")
+                                strike = int(_oi["strikes"][pos])
                                 if option_type == "CALL":
-                                    strike = int(call_parts[0])
-                                    identifier = temp_oi.loc[strike]["identifier_CE"]
-                                    price = temp_oi.loc[strike]["CALL_value_Bid"]
+                                    identifier = _oi["ce_ident"][pos]
+                                    price = _oi["ce_bid"][pos]
                                 else:
-                                    strike = int(put_parts[0])
-                                    identifier = temp_oi.loc[strike]["identifier_PE"]
-                                    price = temp_oi.loc[strike]["put_value_Bid"]
-                                enter_order(identifier, price, option_type, strike, live_mode=_live_mode)
-                                _order_manager.order_flag = True
+                                    identifier = _oi["pe_ident"][pos]
+                                    price = _oi["pe_bid"][pos]
+                                enter_order(identifier, price, option_type, strike, live_mode=ctx.live_mode, order_mgr=order_mgr)
+                                order_mgr.order_flag.set()
                                 logger.info(f"Order placed: {option_type} {strike} @ {price}")
                             except Exception as e:
                                 logger.error(f"Order placement failed: {e}")
 
                 # Close at 15:00
-                if datetime.now().time() >= datetime.strptime("15:00", "%H:%M").time():
-                    if _order_manager and _order_manager.open_trades:
-                        for ident, trade in list(_order_manager.open_trades.items()):
+                if loop_t >= _SQUARE_OFF:
+                    if order_mgr and order_mgr.open_trades:
+                        for ident, trade in list(order_mgr.open_trades.items()):
                             try:
-                                parts = trade["Option"].split()
+                                parts = trade.option.split()
                                 strike = int(parts[0])
-                                typ = trade["Type"]
+                                typ = trade.type
                                 price = temp_oi.loc[strike]["CALL_value_Bid"] if typ == "CALL" else temp_oi.loc[strike]["put_value_Bid"]
-                                _order_manager.close_paper_trade(ident, price)
+                                order_mgr.close_trade(ident, price)
                                 logger.info(f"Order closed: {typ} {strike} @ {price}")
-                            except Exception:
-                                _order_manager.close_paper_trade(ident, None)
-                        _order_manager.order_flag = False
+                            except Exception as e:
+                                logger.error(f"Square-off failed for {ident}, left to the TP/SL monitor: {e}")
+                        order_mgr.order_flag.clear()
 
             except Exception as e:
                 logger.error(f"Loop error: {e}")
-                time.sleep(5)
+                if stop_event.wait(5):
+                    break
 
-            time.sleep(300)
+            if stop_event.wait(300):
+                break
         else:
-            time.sleep(60)
+            if stop_event.wait(60):
+                break
+
+    nifty_log.close()
+    oi_log.close()
 
 
 ## -----------------------------
 # Runner Wrappers
 # -----------------------------
 
-_runner_thread = None
-_runner_stop_event = None
-
 def _runner_target(client_id, access_token, access_key, stop_event, live_mode):
-    run_loop(client_id, access_token, access_key, stop_event, live_mode)
+    try:
+        run_loop(client_id, access_token, access_key, stop_event, live_mode)
+    finally:
+        with CTX.lock:
+            if CTX.runner_thread is threading.current_thread():
+                CTX.runner_thread = None   # report stopped to status watchers, not "alive until return"
+        _notify_status()
 
 def start_runner(client_id=None, access_token=None, access_key=None, live_mode=False):
-    global _runner_thread, _runner_stop_event
-
     # If thread is already running, return
-    if _runner_thread and _runner_thread.is_alive():
+    if is_runner_running():
         return
 
     # --- Market time checks ---
@@ -456,28 +838,59 @@ def start_runner(client_id=None, access_token=None, access_key=None, live_mode=F
         logger.info("Markets are closed. Runner will not start.")
         return
 
+    # --- Let a stopped run finish its cleanup first, so two run_loops never share the tick logs ---
+    old_thread = CTX.runner_thread
+    if old_thread is not None and old_thread.is_alive():
+        old_thread.join(RUNNER_JOIN_TIMEOUT)
+        if old_thread.is_alive():
+            logger.warning("Previous runner is still shutting down; not starting a new one.")
+            return
+
     # --- Start runner thread ---
-    _runner_stop_event = threading.Event()
-    _runner_thread = threading.Thread(
-        target=_runner_target,
-        args=(client_id, access_token, access_key, _runner_stop_event, live_mode),
-        daemon=True,
-    )
-    _runner_thread.start()
+    with CTX.lock:
+        if CTX.runner_thread is not None and CTX.runner_thread.is_alive():
+            return
+        CTX.stop_event = threading.Event()
+        CTX.runner_thread = threading.Thread(
+            target=_runner_target,
+            args=(client_id, access_token, access_key, CTX.stop_event, live_mode),
+            daemon=True,
+        )
+        CTX.runner_thread.start()
+    _notify_status()
     logger.info(f"Runner thread started (live_mode={live_mode})")
 
 
 def stop_runner():
-    global _runner_thread, _runner_stop_event
-    if _runner_thread and _runner_thread.is_alive():
-        _runner_stop_event.set()
-        _runner_thread = None
-        logger.info("Runner thread stopped")
+    with CTX.lock:
+        if not is_runner_running():
+            return
+        CTX.stop_event.set()   # the thread stays registered until run_loop has cleaned up and returned
+    _notify_status()
+    logger.info("Runner stop requested")
 
 
 def is_runner_running():
-    return _runner_thread is not None and _runner_thread.is_alive()
+    """True while a runner thread is alive and has not been asked to stop."""
+    thread = CTX.runner_thread
+    return thread is not None and thread.is_alive() and not CTX.stop_event.is_set()
 
 
 def get_last_tick_time():
-    return _last_tick_time
\ No newline at end of file
+    return CTX.last_tick
+
+
+# -----------------------------
+# Status push
+# -----------------------------
+def _notify_status():
+    with CTX.status_changed:
+        CTX.status_version += 1
+        CTX.status_changed.notify_all()
+
+
+def wait_for_status(version, timeout=None):
+    """Block until the runner status moves past `version` (or `timeout`). Returns (version, running, last_tick)."""
+    with CTX.status_changed:
+        CTX.status_changed.wait_for(lambda: CTX.status_version != version, timeout)
+        return CTX.status_version, is_runner_running(), CTX.last_tick
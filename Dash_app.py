@@ -4,12 +4,19 @@ from dash import dcc, html, dash_table
 from dash.dependencies import Input, Output, State
 import socket
 import os
-import pickle
+import io
+import threading
+import functools
 import dash.exceptions
+import flask
+import plotly.io as pio
+import json
+from dash_extensions import WebSocket
+from flask_sock import Sock
 # Import modules from Core_Code
 from Core_Code.dhan_service import DhanService
 from Core_Code.nse_data_fetch import get_nifty_hist_data
-from Core_Code.strategy_engine import start_runner, stop_runner, is_runner_running, init_services, get_last_tick_time
+from Core_Code.strategy_engine import start_runner, stop_runner, is_runner_running, init_services, get_last_tick_time, wait_for_status
 from Core_Code.order_manager import OrderManager
 
 # PROJECT PATHS
@@ -20,9 +27,10 @@ os.makedirs(ASSETS_DIR, exist_ok=True)
 CRED_FILE = os.path.join(ASSETS_DIR, "credentials.txt")
 
 # Helper to read/write credentials
-def read_credentials():
+@functools.lru_cache(maxsize=1)
+def _read_credentials(mtime_ns):
     creds = {"client_id": "", "access_token": "", "access_key": ""}
-    if os.path.exists(CRED_FILE):
+    if mtime_ns:
         with open(CRED_FILE, "r") as f:
             for line in f:
                 if "=" in line:
@@ -30,6 +38,12 @@ def read_credentials():
                     creds[k.strip()] = v.strip()
     return creds
 
+
+def read_credentials():
+    """Parsed credentials file, re-read only when its mtime changes."""
+    mtime_ns = os.stat(CRED_FILE).st_mtime_ns if os.path.exists(CRED_FILE) else 0
+    return dict(_read_credentials(mtime_ns))
+
 def write_credentials(client_id, access_token, access_key):
     os.makedirs(ASSETS_DIR, exist_ok=True)
     with open(CRED_FILE, "w") as f:
@@ -39,9 +53,9 @@ def write_credentials(client_id, access_token, access_key):
 
 # Data files (in assets)
 DATA_FILES = {
-    "nifty_data": os.path.join(ASSETS_DIR, "nifty_data.pickle"),
-    "temp_OI_data": os.path.join(ASSETS_DIR, "temp_OI_data.pickle"),
-    "OI_RUNNING_data": os.path.join(ASSETS_DIR, "OI_RUNNING_data.pickle"),
+    "nifty_data": os.path.join(ASSETS_DIR, "nifty_data.csv"),
+    "temp_OI_data": os.path.join(ASSETS_DIR, "temp_OI_data.feather"),
+    "OI_RUNNING_data": os.path.join(ASSETS_DIR, "OI_RUNNING_data.csv"),
 }
 IMAGE_FILES = [
     os.path.join(ASSETS_DIR, "Nifty_chart_plot.jpg"),
@@ -49,10 +63,40 @@ IMAGE_FILES = [
     os.path.join(ASSETS_DIR, "VWAP_Plot.jpg"),
 ]
 TRADE_LOG = os.path.join(ASSETS_DIR, "paper_trades.csv")
+TABLE_ROWS = 20  # rows shown per data table
+TRADE_LOG_ROWS = 50
+
+# Dash serializes callback responses through plotly's JSON layer; orjson builds the table payloads natively
+pio.json.config.default_engine = "orjson"
 
 # Initialize app
 app = dash.Dash(__name__)
 app.title = "Nifty Options Strategy Dashboard"
+server = app.server  # WSGI entry point: gunicorn -k gthread -w 1 --threads 8 Dash_app:server
+sock = Sock(server)
+
+PLOT_MAX_AGE = 900  # seconds browsers may reuse a plot image before revalidating
+
+STATUS_WS_PATH = "/ws/status"
+STATUS_KEEPALIVE = 60  # seconds between pushes when the runner is idle
+# Each open socket holds a gthread worker (Procfile: --threads 8); cap them so callbacks and assets keep threads
+STATUS_WS_MAX = 4
+STATUS_POLL_MS = 5*60*1000        # status-interval while the socket is pushing
+STATUS_FALLBACK_POLL_MS = 60*1000  # status-interval when the socket is refused or closed
+_status_ws_slots = threading.BoundedSemaphore(STATUS_WS_MAX)
+
+
+@server.after_request
+def cache_plot_images(response):
+    """Let browsers keep the plot JPGs; Flask's ETag/Last-Modified answer revalidation with 304s."""
+    path = flask.request.path
+    if path.startswith(app.get_asset_url("")) and path.endswith(".jpg"):
+        response.cache_control.no_cache = None   # Dash marks every asset no-cache
+        response.cache_control.public = True
+        response.cache_control.max_age = PLOT_MAX_AGE
+        response.cache_control.must_revalidate = True
+    return response
+
 
 # Preload creds to pre-fill inputs
 creds = read_credentials()
@@ -66,7 +110,7 @@ app.layout = html.Div([
                   value=creds.get('client_id', ''), style={'marginRight': '8px'}),
         dcc.Input(id='input-access-token', placeholder='Dhan Access Token',
                   type='password', value=creds.get('access_token', ''), style={'marginRight': '8px'}),
-        dcc.Input(id='input-access-key', placeholder='Dhan Access Key',
+        dcc.Input(id='input-access-key', placeholder='Dhan Access Key (optional)',
                   type='password', value=creds.get('access_key', ''), style={'marginRight': '8px'}),
         html.Button('💾 Save Credentials', id='save-creds-btn',
                     n_clicks=0, style={'marginRight': '8px'}),
@@ -93,12 +137,15 @@ app.layout = html.Div([
 
     html.Div([
         html.H3(id='status-message', children="Status: Idle", style={'color': 'blue'}),
-        dcc.Interval(id='status-interval', interval=5*60*1000, n_intervals=0)  # refresh every 5min
+        WebSocket(id='status-ws'),  # runner pushes status on every tick/start/stop
+        dcc.Interval(id='status-interval', interval=STATUS_POLL_MS, n_intervals=0)  # fallback if the socket drops
     ], style={'padding': '8px', 'border': '1px solid #eee', 'marginBottom': '16px'}),
 
     html.Div([
         html.Button('🔄 Refresh Data', id='refresh-button', n_clicks=0),
-        dcc.Interval(id='data-interval', interval=15*60*1000, n_intervals=0)  # refresh tables/images every 15 min
+        dcc.Interval(id='data-interval', interval=15*60*1000, n_intervals=0),  # refresh tables/images every 15 min
+        dcc.Store(id='data-tick'),     # data-interval ticks that fired while the tab was visible
+        dcc.Store(id='data-mtimes'),   # file mtimes behind the tables/images this tab is showing
     ], style={'marginBottom': '12px'}),
 
     html.H2("Data Tables (auto-refresh every 15 min)"),
@@ -141,7 +188,8 @@ def save_creds(n_clicks, client_id, access_token, access_key):
     [
         Input('start-runner-btn', 'n_clicks'),
         Input('stop-runner-btn', 'n_clicks'),
-        Input('status-interval', 'n_intervals')
+        Input('status-interval', 'n_intervals'),
+        Input('status-ws', 'message')
     ],
     [
         State('input-client-id', 'value'),
@@ -150,7 +198,7 @@ def save_creds(n_clicks, client_id, access_token, access_key):
         State('trade-mode', 'value'),
     ]
 )
-def control_runner(start_clicks, stop_clicks, n_intervals,
+def control_runner(start_clicks, stop_clicks, n_intervals, ws_message,
                    client_id, access_token, access_key, trade_mode):
     ctx = dash.callback_context
     if not ctx.triggered:
@@ -165,9 +213,12 @@ def control_runner(start_clicks, stop_clicks, n_intervals,
     btn = ctx.triggered[0]['prop_id'].split('.')[0]
 
     if btn == 'start-runner-btn':
-        # --- CORRECTION 2: Check all three values are provided ---
-        if not client_id or not access_token or not access_key:
-            return "Status: Provide Client ID, Access Token, and Access Key before starting."
+        # --- CORRECTION 2: Client ID and Access Token are required (Access Key is optional) ---
+        if not client_id or not access_token:
+            return "Status: Provide Client ID and Access Token before starting."
+        if is_runner_running():
+            # Re-initialising would swap out the live runner's order manager and feeds
+            return "Status: Runner already running."
         try:
             init_services(client_id, access_token, access_key or "")
             start_runner(client_id, access_token, access_key or "",
@@ -183,46 +234,152 @@ def control_runner(start_clicks, stop_clicks, n_intervals,
         except Exception as e:
             return f"Status: Stop failed: {e}"
             
-    else: # status-interval tick
-        running = is_runner_running()
-        tick = get_last_tick_time()
+    else: # status-interval tick or status push
+        if btn == 'status-ws' and ws_message:
+            status = json.loads(ws_message['data'])
+            running, tick = status['running'], status['last_tick']
+        else:
+            running = is_runner_running()
+            tick = get_last_tick_time()
         if tick:
             return f"Status: Runner running = {running} | Last tick: {tick} | "
         else:
             return f"Status: Runner running = {running} | No tick yet  | "
 
 
-def load_pickle(path):
-    if not os.path.exists(path):
+# Status push: point the socket at this host, then stream {running, last_tick} from the runner
+app.clientside_callback(
+    f"function(id) {{ return (location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '{STATUS_WS_PATH}'; }}",
+    Output('status-ws', 'url'),
+    Input('status-ws', 'id'),
+)
+
+
+# Poll faster whenever the socket is not open (over the cap, dropped, or not yet connected)
+app.clientside_callback(
+    f"function(state) {{ return state && state.readyState === 1 ? {STATUS_POLL_MS} : {STATUS_FALLBACK_POLL_MS}; }}",
+    Output('status-interval', 'interval'),
+    Input('status-ws', 'state'),
+)
+
+
+@sock.route(STATUS_WS_PATH)
+def status_ws(ws):
+    if not _status_ws_slots.acquire(blocking=False):
+        ws.close(reason=1013, message="Status push at capacity")  # 1013 = try again later
+        return
+    try:
+        version = None
+        while True:
+            version, running, tick = wait_for_status(version, timeout=STATUS_KEEPALIVE)
+            ws.send(json.dumps({"running": running, "last_tick": tick}))
+    finally:
+        _status_ws_slots.release()
+
+
+# Table payloads keyed by path -> (st_mtime_ns, payload); rebuilt only when the file changes
+_FILE_CACHE = {}
+_FILE_CACHE_LOCK = threading.Lock()
+
+
+def _load_cached(path, loader):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
         return None
+    with _FILE_CACHE_LOCK:
+        entry = _FILE_CACHE.get(path)
+    if entry and entry[0] == mtime:
+        return entry[1]
     try:
-        with open(path, 'rb') as f:
-            return pickle.load(f)
+        obj = loader(path)
     except Exception:
         return None
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE[path] = (mtime, obj)
+    return obj
+
+
+def _table_payload(df, rows):
+    """DataTable columns/data for the last `rows` rows, built once per file version."""
+    return {
+        "columns": [{"name": c, "id": c} for c in df.columns],
+        "data": df.tail(rows).to_dict('records'),
+    }
+
+
+def load_feather_table(path, rows=TABLE_ROWS):
+    import pandas as pd
+    return _load_cached(path, lambda p: _table_payload(pd.read_feather(p, memory_map=True), rows))
+
+
+def _read_csv_tail(path, n):
+    """Parse only the header and the last `n` rows of an append-only CSV log."""
+    import pandas as pd
+    with open(path, 'rb') as f:
+        header = f.readline()
+        body_start = f.tell()
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        chunk = b""
+        # Walk back in blocks until we hold n full lines (plus the partial one we cut into)
+        while pos > body_start and chunk.count(b"\n") <= n:
+            step = min(64 * 1024, pos - body_start)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + chunk
+    lines = chunk.splitlines(keepends=True)
+    if pos > body_start:
+        lines = lines[1:]   # first line may start mid-row
+    return pd.read_csv(io.BytesIO(header + b"".join(lines[-n:])))
+
+
+def load_csv_table(path, rows=TABLE_ROWS):
+    return _load_cached(path, lambda p: _table_payload(_read_csv_tail(p, rows), rows))
+
+
+# Forward data-interval ticks only while the tab is visible, so hidden tabs never hit refresh()
+app.clientside_callback(
+    "function(n) { return document.hidden ? window.dash_clientside.no_update : n; }",
+    Output('data-tick', 'data'),
+    Input('data-interval', 'n_intervals'),
+    prevent_initial_call=True,
+)
+
+
+def _data_mtimes():
+    paths = [*DATA_FILES.values(), *IMAGE_FILES, TRADE_LOG]
+    return [os.path.getmtime(p) if os.path.exists(p) else None for p in paths]
 
 
 @app.callback(
     [Output('data-tables-container', 'children'),
      Output('image-plots-container', 'children'),
-     Output('trade-log-container', 'children')],
+     Output('trade-log-container', 'children'),
+     Output('data-mtimes', 'data')],
     [Input('refresh-button', 'n_clicks'),
-     Input('data-interval', 'n_intervals')]
+     Input('data-tick', 'data')],
+    State('data-mtimes', 'data')
 )
-def refresh(n_clicks, n_intervals):
-    nifty = load_pickle(DATA_FILES['nifty_data'])
-    temp_oi = load_pickle(DATA_FILES['temp_OI_data'])
-    oi_run = load_pickle(DATA_FILES['OI_RUNNING_data'])
+def refresh(n_clicks, data_tick, seen_mtimes):
+    mtimes = _data_mtimes()
+    # Interval ticks skip the reload when nothing on disk changed; button clicks and page loads always render
+    if dash.callback_context.triggered_id == 'data-tick' and mtimes == seen_mtimes:
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+    nifty = load_csv_table(DATA_FILES['nifty_data'])
+    temp_oi = load_feather_table(DATA_FILES['temp_OI_data'])
+    oi_run = load_csv_table(DATA_FILES['OI_RUNNING_data'])
 
     tables = []
-    def make_table(df, title):
-        if df is None or (hasattr(df, 'empty') and df.empty):
+    def make_table(payload, title):
+        if payload is None or not payload["data"]:
             return html.Div(f"No data for {title}", style={'marginBottom': '12px'})
         return html.Div([
             html.H4(title),
             dash_table.DataTable(
-                columns=[{"name": c, "id": c} for c in df.columns],
-                data=df.tail(20).to_dict('records'),
+                columns=payload["columns"],
+                data=payload["data"],
                 page_size=10,
                 style_table={'overflowX': 'auto'}
             )
@@ -235,31 +392,30 @@ def refresh(n_clicks, n_intervals):
     images = []
     for p in IMAGE_FILES:
         if os.path.exists(p):
-            # Check for a way to bust image cache by appending timestamp
-            images.append(html.Img(src=f"{p}?t={os.path.getmtime(p)}",
+            # Served from Dash's /assets route; the mtime query busts the browser cache only when the plot changes
+            images.append(html.Img(src=f"{app.get_asset_url(os.path.basename(p))}?v={int(os.path.getmtime(p))}",
                                    style={'width': '85%', 'maxWidth': '1000px', 'marginBottom': '12px'}))
         else:
             images.append(html.Div(f"Image not found: {os.path.basename(p)}"))
 
-    trade_log_path = os.path.join(ASSETS_DIR, "paper_trades.csv")
+    trade_log_path = TRADE_LOG
     trade_table = html.Div("No trade log found.")
     if os.path.exists(trade_log_path):
-        try:
-            import pandas as pd
-            df = pd.read_csv(trade_log_path)
+        payload = load_csv_table(trade_log_path, TRADE_LOG_ROWS)
+        if payload is None:
+            trade_table = html.Div("Failed to load trade log.")
+        else:
             trade_table = html.Div([
-                html.H4("Paper Trades (last 50)"),
+                html.H4(f"Paper Trades (last {TRADE_LOG_ROWS})"),
                 dash_table.DataTable(
-                    columns=[{"name": c, "id": c} for c in df.columns],
-                    data=df.tail(50).to_dict('records'),
+                    columns=payload["columns"],
+                    data=payload["data"],
                     page_size=10,
                     style_table={'overflowX': 'auto'}
                 )
             ])
-        except Exception:
-            trade_table = html.Div("Failed to load trade log.")
 
-    return tables, images, trade_table
+    return tables, images, trade_table, mtimes
 
 
 # -----------------------------
@@ -275,5 +431,6 @@ if __name__ == "__main__":
         debug=debug_mode,
         host="0.0.0.0",
         port=port,
+        threaded=True,
         use_reloader=debug_mode
     )
\ No newline at end of file